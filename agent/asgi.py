@@ -0,0 +1,171 @@
+"""Async serving mode for the agent, with the same HTTP contract as app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+Model calls go through the async Gemini client, so a single process keeps many
+analyses in flight instead of parking one worker thread per request.
+"""
+# First, so startup timing covers every other import
+from startup import startup
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.middleware import Middleware
+from starlette.routing import Route
+
+import batch
+import metrics
+import pipeline
+import streaming
+import uploads
+from logs import get_logger
+from pipeline import AnalysisError, run_analysis_async, types_registry
+
+log = get_logger("asgi")
+
+metrics.REGISTRY.register(metrics.SnapshotGauge("agent_startup", "Startup phase durations and readiness", startup.snapshot))
+
+REQUIRED_FIELDS = ("description", "type", "severity")
+
+
+def too_large(limit):
+    return JSONResponse({"error": f"Request too large; the limit is {limit} bytes"}, status_code=413)
+
+
+class BodySizeLimit:
+    """413 for a body over the route's limit: up front from Content-Length, or while a chunked body streams in"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = batch.BATCH_MAX_CONTENT_LENGTH if scope["path"] == "/analyze/batch" else uploads.MAX_CONTENT_LENGTH
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await too_large(limit)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(413, f"Request too large; the limit is {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def http_error(request, e):
+    return JSONResponse({"error": e.detail}, status_code=e.status_code, headers=e.headers)
+
+
+async def analyze(request):
+    with metrics.span("upload_read"):
+        form = await request.form()
+        part = form.get("image")
+        if part is None or isinstance(part, str) or any(field not in form for field in REQUIRED_FIELDS):
+            await form.close()
+            return JSONResponse({"error": "image, description, type and severity are required"}, status_code=400)
+        # Starlette has already spooled the part; the Upload takes over its file
+        upload = await run_in_threadpool(uploads.adopt, part.file)
+    input_desc = form["description"]
+    input_type = form["type"]
+    input_severity = form["severity"]
+
+    log.sampled("analyze_request", image_bytes=upload.size, type=input_type, severity=input_severity,
+                has_description=bool(input_desc.strip()))
+
+    stream = streaming.stream_format(request.query_params.get("stream"), request.headers.get("accept"))
+    if stream:
+        events = streaming.stream_analysis_async(
+            stream, run_analysis_async, upload, input_desc, input_type, input_severity)
+        return StreamingResponse(events, media_type=streaming.MEDIA_TYPES[stream], headers=streaming.STREAM_HEADERS)
+
+    try:
+        final_result = await run_analysis_async(upload, input_desc, input_type, input_severity)
+    except AnalysisError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        return JSONResponse(e.payload, status_code=e.status, headers=headers)
+
+    return JSONResponse(final_result)
+
+
+async def analyze_batch(request):
+    """Many submissions in one request; NDJSON results stream back as each item finishes (see batch.py)"""
+    try:
+        with metrics.span("upload_read"):
+            if request.headers.get("content-type", "").split(";")[0].strip() == batch.NDJSON_TYPE:
+                items = batch.items_from_ndjson(await request.body())
+            else:
+                form = await request.form(max_files=batch.BATCH_MAX_ITEMS + 1, max_fields=4 * batch.BATCH_MAX_ITEMS + 4)
+                fields = {name: value for name, value in form.items() if isinstance(value, str)}
+                files = {name: await run_in_threadpool(batch.take_upload, uploads.adopt, value.file)
+                         for name, value in form.items() if not isinstance(value, str)}
+                items = batch.items_from_multipart(fields, files)
+    except batch.BatchError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    log.info("batch_request", items=len(items), unique_images=batch.unique_images(items),
+             groups=len(batch.group_items(items)))
+    lines = batch.run_batch_async(items, run_analysis_async, error_types=(AnalysisError,))
+    return StreamingResponse(lines, media_type=batch.NDJSON_TYPE)
+
+
+async def refresh_types(request):
+    """Re-fetch the types list from the Node API; a POST body is only a signal (see app.py)"""
+    await run_in_threadpool(types_registry.refresh)
+    snapshot = types_registry.snapshot()
+    return JSONResponse({"message": "Types refreshed.", "types": list(snapshot.names), "version": snapshot.version})
+
+
+async def cache_stats(request):
+    return JSONResponse({
+        **pipeline.result_cache.snapshot(),
+        **pipeline.near_duplicates.snapshot(),
+        **pipeline.inflight.snapshot(),
+    })
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    status, body = startup.readiness()
+    return JSONResponse(body, status_code=status)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.start(pipeline.backend, types_registry, pipeline.warm_up_calls)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/analyze/batch", analyze_batch, methods=["POST"]),
+        Route("/refresh-types", refresh_types, methods=["GET", "POST"]),
+        Route("/cache-stats", cache_stats, methods=["GET"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+    ],
+    middleware=[Middleware(BodySizeLimit)],
+    exception_handlers={413: http_error},
+    lifespan=lifespan,
+)
+
+startup.imported()
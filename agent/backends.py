@@ -0,0 +1,286 @@
+"""Model backends behind the pipeline's ModelCalls.
+
+MODEL_BACKEND picks one at startup:
+
+- "gemini" (default): the Gemini API, one model per system instruction (model_pool).
+- "fake": a local stand-in that answers with schema-valid JSON after a sampled
+  delay, with configurable error and garbage-reply rates. It needs no network or
+  API key, so the agent's own overhead, queueing and throughput can be measured
+  on one box.
+
+A backend exposes generate(call, timeout) and async generate_async(call, timeout),
+both returning (reply, context_cached). The reply has .text and .usage_metadata like a Gemini response.
+init() sets up the client, ready says whether that is done, and
+warm_up(calls, timeout) prepares for serving those calls.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from PIL import Image
+
+from logs import get_logger
+from model_pool import ModelPool, genai
+from preprocess import TOKENS_PER_TILE, estimate_image_tokens
+
+log = get_logger("backends")
+
+
+def _request_options(timeout):
+    return {"timeout": timeout} if timeout else None
+
+
+class GeminiBackend:
+    """The SDK is imported and configured by init(), at startup or on the first call"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.models = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.models is not None
+
+    def init(self):
+        if self.models is None:
+            with self._lock:
+                if self.models is None:
+                    genai().configure(api_key=self.api_key)
+                    self.models = ModelPool()
+        return self.models
+
+    def warm_up(self, calls, timeout=None):
+        """Open the API connection and create the models (and context caches) for these calls"""
+        models = self.init()
+        genai().get_model(f"models/{models.model_name}", request_options=_request_options(timeout))
+        for call in calls:
+            models.get(call.prompt_key, call.system_instruction)
+
+    def generate(self, call, timeout=None):
+        model, context_cached = self.init().get(call.prompt_key, call.system_instruction)
+        reply = model.generate_content(
+            call.contents, generation_config=call.generation_config, request_options=_request_options(timeout)
+        )
+        return reply, context_cached
+
+    async def generate_async(self, call, timeout=None):
+        # Creating cached context is a blocking API call; only the first call per prompt pays it
+        models = self.models or await asyncio.to_thread(self.init)
+        found = models.peek(call.prompt_key)
+        if found is None:
+            found = await asyncio.to_thread(models.get, call.prompt_key, call.system_instruction)
+        model, context_cached = found
+        reply = await model.generate_content_async(
+            call.contents, generation_config=call.generation_config, request_options=_request_options(timeout)
+        )
+        return reply, context_cached
+
+    def snapshot(self):
+        return self.models.snapshot() if self.models is not None else {}
+
+
+class FakeBackendError(RuntimeError):
+    """Injected failure, standing in for a model API error"""
+
+
+class LatencyDistribution:
+    """Parsed from "fixed:S", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds)"""
+
+    def __init__(self, spec):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if expected.get(self.kind) != len(self.params):
+            raise ValueError(f"bad latency spec {spec!r}")
+        self.spec = spec
+
+    def sample(self, rng):
+        p = self.params
+        if self.kind == "fixed":
+            return p[0]
+        if self.kind == "uniform":
+            return rng.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(p[0], p[1]))
+        return rng.lognormvariate(0.0, p[1]) * p[0]
+
+
+SEVERITIES = ("Low", "Medium", "High")
+USER_TYPE = re.compile(r"type of incident = '([^']*)'")
+REASONING_PREFIX = "Reasoning generated from analyzing the image:"
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _image_tokens(part):
+    """Billed like Gemini, by the image's size; only the header is decoded"""
+    try:
+        return estimate_image_tokens(*Image.open(io.BytesIO(part["data"])).size)
+    except (OSError, ValueError):
+        return TOKENS_PER_TILE
+
+
+def _prompt_tokens(call):
+    tokens = _estimate_tokens(call.system_instruction or "")
+    for part in call.contents:
+        tokens += _image_tokens(part) if isinstance(part, dict) else _estimate_tokens(part)
+    return tokens
+
+
+class FakeBackend:
+    """Deterministic stand-in for Gemini.
+
+    Verdicts are a function of the call's contents and the seed, so the same
+    request always gets the same answer; latency and injected failures come from
+    a seeded generator shared by all calls.
+    """
+
+    def __init__(self, latency="lognormal:0.8,0.35", stage_latency=None, error_rate=0.0, invalid_rate=0.0, seed=0,
+                 latency_per_1k_tokens=0.0):
+        self.latency = LatencyDistribution(latency)
+        # Extra delay per 1000 prompt tokens, so larger images take longer as they do on the real API
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.stage_latency = {stage: LatencyDistribution(spec) for stage, spec in (stage_latency or {}).items()}
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "injected_errors": 0, "injected_invalid": 0}
+        self.calls = {}
+
+    def _plan(self, call):
+        """Delay and outcome for one call, drawn under the lock so runs are reproducible"""
+        distribution = self.stage_latency.get(call.stage, self.latency)
+        with self._lock:
+            delay = distribution.sample(self._rng)
+            roll = self._rng.random()
+            self.stats["calls"] += 1
+            self.calls[call.stage] = self.calls.get(call.stage, 0) + 1
+            if roll < self.error_rate:
+                outcome = "error"
+                self.stats["injected_errors"] += 1
+            elif roll < self.error_rate + self.invalid_rate:
+                outcome = "invalid"
+                self.stats["injected_invalid"] += 1
+            else:
+                outcome = "ok"
+        if self.latency_per_1k_tokens:
+            delay += self.latency_per_1k_tokens * _prompt_tokens(call) / 1000
+        return delay, outcome
+
+    def _reply(self, call, outcome):
+        if outcome == "error":
+            raise FakeBackendError(f"injected {call.stage} failure")
+        if outcome == "invalid":
+            return self._response(call, "I could not analyse this image.")
+        return self._response(call, json.dumps(self._payload(call)))
+
+    def _payload(self, call):
+        digest = hashlib.sha256(str(self.seed).encode())
+        user_type = "other"
+        reasoning = None
+        for part in call.contents:
+            if isinstance(part, dict):
+                digest.update(part["data"])
+            else:
+                digest.update(part.encode("utf-8"))
+                match = USER_TYPE.search(part)
+                if match and match.group(1).strip():
+                    user_type = match.group(1).strip()
+                if part.startswith(REASONING_PREFIX):
+                    reasoning = part[len(REASONING_PREFIX):].strip()
+        h = digest.digest()
+        probability = round(h[0] / 255, 2)
+        severity = SEVERITIES[h[1] % 3]
+        image = {
+            "disaster_probability": probability,
+            "disaster_type": user_type,
+            "disaster_severity": severity,
+            "reasoning": f"A {severity.lower()} severity {user_type} scene with visible damage.",
+        }
+        # The description stage only sees stage 1's reasoning, so it summarises that
+        summary = reasoning or image["reasoning"]
+        has_description = any(isinstance(part, str) and part.startswith("The user provided") for part in call.contents)
+        desc = {
+            "description_similarity_score": round(h[2] / 255, 2) if has_description else -1,
+            "reformulated_description": f"Reports from the scene: {summary}",
+        }
+        if call.stage == "image":
+            return image
+        if call.stage == "description":
+            return desc
+        return {**image, **desc}
+
+    def _response(self, call, text):
+        prompt_tokens = _prompt_tokens(call)
+        output_tokens = _estimate_tokens(text)
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            cached_content_token_count=0,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate(self, call, timeout=None):
+        delay, outcome = self._plan(call)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{call.stage} call timed out after {timeout:.1f}s")
+        time.sleep(delay)
+        return self._reply(call, outcome), False
+
+    async def generate_async(self, call, timeout=None):
+        delay, outcome = self._plan(call)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"{call.stage} call timed out after {timeout:.1f}s")
+        await asyncio.sleep(delay)
+        return self._reply(call, outcome), False
+
+    ready = True
+
+    def init(self):
+        return self
+
+    def warm_up(self, calls, timeout=None):
+        pass
+
+    def snapshot(self):
+        return dict(self.stats)
+
+
+def backend_from_env():
+    name = os.getenv("MODEL_BACKEND", "gemini").lower()
+    if name == "fake":
+        stage_latency = {}
+        for stage in ("image", "description", "fused"):
+            spec = os.getenv(f"FAKE_LATENCY_{stage.upper()}")
+            if spec:
+                stage_latency[stage] = spec
+        backend = FakeBackend(
+            latency=os.getenv("FAKE_LATENCY", "lognormal:0.8,0.35"),
+            stage_latency=stage_latency,
+            error_rate=float(os.getenv("FAKE_ERROR_RATE", "0")),
+            invalid_rate=float(os.getenv("FAKE_INVALID_RATE", "0")),
+            seed=int(os.getenv("FAKE_SEED", "0")),
+            latency_per_1k_tokens=float(os.getenv("FAKE_LATENCY_PER_1K_TOKENS", "0")),
+        )
+        log.warning("fake_backend_enabled", latency=backend.latency.spec, error_rate=backend.error_rate,
+                    invalid_rate=backend.invalid_rate)
+        return backend
+    if name != "gemini":
+        raise ValueError(f"unknown MODEL_BACKEND {name!r}")
+    return GeminiBackend(os.getenv("GOOGLE_API_KEY"))
@@ -0,0 +1,267 @@
+"""Batch analysis: many submissions in one request, results streamed back as NDJSON.
+
+Two request formats are accepted:
+
+- multipart/form-data with numbered parts per item: image_<i> (file),
+  description_<i>, type_<i>, severity_<i> and an optional id_<i>
+- application/x-ndjson, one JSON object per line:
+  {"id": "...", "image": "<base64>", "description": "...", "type": "...", "severity": "..."}
+
+Items with the same image bytes, type and severity are grouped and run one
+after another, so the first one's stage-1 verdict (near-duplicate index) and
+identical submissions (result cache) are reused instead of paying for the
+model again. Items that only share the photo can't reuse stage 1, so they go
+in separate groups. Groups run concurrently up to the batch's concurrency
+limit and every item is written out as soon as it finishes. An image over
+MAX_CONTENT_LENGTH fails only its own item, in either format:
+
+    {"index": 0, "id": "a", "status": 200, "result": {...FinalOutput...}}
+    {"index": 1, "id": "b", "status": 400, "error": {"error": "..."}}
+    {"done": true, "items": 2, "unique_images": 1, "groups": 1, "failed": 1}
+"""
+import asyncio
+import base64
+import binascii
+import json
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from cache import normalize_field
+from logs import get_logger
+from metrics import BATCH_ITEMS
+from uploads import MAX_CONTENT_LENGTH, Upload, UploadTooLarge
+
+log = get_logger("batch")
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Whole-request cap for /analyze/batch; each image is still held to MAX_CONTENT_LENGTH
+BATCH_MAX_CONTENT_LENGTH = int(os.getenv("BATCH_MAX_CONTENT_LENGTH", str(128 * 1024 * 1024)))
+NDJSON_TYPE = "application/x-ndjson"
+
+FIELDS = ("description", "type", "severity")
+PART_NAME = re.compile(r"^(image|id|description|type|severity)_(\d+)$")
+
+
+class BatchError(Exception):
+    """The request as a whole can't be processed (400)"""
+
+
+@dataclass
+class BatchItem:
+    index: int
+    id: str
+    upload: Upload = None
+    description: str = None
+    type: str = None
+    severity: str = None
+    error: str = None
+
+    @property
+    def digest(self):
+        return self.upload.digest if self.upload is not None else None
+
+    @property
+    def fields_key(self):
+        return tuple(normalize_field(getattr(self, name)) for name in FIELDS)
+
+    @property
+    def stage1_key(self):
+        """What the stage-1 verdict depends on; the types version is the same for the whole batch"""
+        return self.digest, normalize_field(self.type), normalize_field(self.severity)
+
+
+def _check_size(count):
+    if count == 0:
+        raise BatchError("The batch contains no items")
+    if count > BATCH_MAX_ITEMS:
+        raise BatchError(f"The batch has {count} items; the limit is {BATCH_MAX_ITEMS}")
+
+
+def _validate(item):
+    if item.error is None:
+        if item.upload is None:
+            item.error = "image is required"
+        elif any(getattr(item, name) is None for name in FIELDS):
+            item.error = "description, type and severity are required"
+    return item
+
+
+def take_upload(adopt, file):
+    """adopt(file), or the UploadTooLarge it raised, which then fails just that item"""
+    try:
+        return adopt(file)
+    except UploadTooLarge as e:
+        return e
+
+
+def items_from_multipart(fields, files):
+    """fields: {name: str}, files: {name: Upload or UploadTooLarge}, using the numbered part names"""
+    items = {}
+    for name, value in list(fields.items()) + list(files.items()):
+        match = PART_NAME.match(name)
+        if not match:
+            continue
+        kind, index = match.group(1), int(match.group(2))
+        item = items.setdefault(index, BatchItem(index=index, id=str(index)))
+        if kind == "image":
+            item.upload = value if isinstance(value, Upload) else None
+            if isinstance(value, UploadTooLarge):
+                item.error = str(value)
+        else:
+            setattr(item, kind, value)
+    _check_size(len(items))
+    return [_validate(items[index]) for index in sorted(items)]
+
+
+def items_from_ndjson(body):
+    lines = [line for line in body.splitlines() if line.strip()]
+    _check_size(len(lines))
+    items = []
+    for index, line in enumerate(lines):
+        item = BatchItem(index=index, id=str(index))
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            item.id = str(data.get("id", index))
+            for name in FIELDS:
+                item_field = data.get(name)
+                setattr(item, name, item_field if isinstance(item_field, str) else None)
+            if isinstance(data.get("image"), str):
+                image = base64.b64decode(data["image"], validate=True)
+                if len(image) > MAX_CONTENT_LENGTH:
+                    raise UploadTooLarge(MAX_CONTENT_LENGTH)
+                item.upload = Upload.from_bytes(image)
+        except (ValueError, binascii.Error) as e:
+            item.error = f"line {index + 1}: {e}"
+        except UploadTooLarge as e:
+            item.error = str(e)
+        items.append(_validate(item))
+    return items
+
+
+def group_items(items):
+    """Valid items grouped by identical image bytes, type and severity, in submission order"""
+    groups = {}
+    for item in items:
+        if item.error is None:
+            groups.setdefault(item.stage1_key, []).append(item)
+    return list(groups.values())
+
+
+def item_line(item, result=None, status=200, error=None):
+    line = {"index": item.index, "id": item.id, "status": status}
+    if error is None:
+        line["result"] = result
+    else:
+        line["error"] = error
+    BATCH_ITEMS.inc(outcome="ok" if error is None else "failed")
+    return (json.dumps(line) + "\n").encode("utf-8")
+
+
+def unique_images(items):
+    return len({item.digest for item in items if item.error is None})
+
+
+def summary_line(items, groups, failed):
+    line = {"done": True, "items": len(items), "unique_images": unique_images(items), "groups": len(groups),
+            "failed": failed}
+    return (json.dumps(line) + "\n").encode("utf-8")
+
+
+def _failure(item, e, error_types):
+    """(result, status, error) for an item whose analysis raised"""
+    if isinstance(e, error_types):
+        return None, e.status, e.payload
+    log.error("batch_item_failed", index=item.index, error=str(e), exc_info=True)
+    return None, 500, {"error": "Analysis failed", "details": str(e)}
+
+
+def _outcome(analyze, item, memo, error_types):
+    """(result, status, error) for one item, reusing an identical earlier item's outcome"""
+    key = item.fields_key
+    if key not in memo:
+        try:
+            memo[key] = analyze(item.upload, item.description, item.type, item.severity), 200, None
+        except Exception as e:
+            memo[key] = _failure(item, e, error_types)
+    return memo[key]
+
+
+def run_batch(items, analyze, error_types=(), concurrency=BATCH_CONCURRENCY):
+    """Blocking generator of NDJSON lines, in completion order"""
+    groups = group_items(items)
+    failed = 0
+    for item in items:
+        if item.error is not None:
+            failed += 1
+            yield item_line(item, status=400, error={"error": item.error})
+    if groups:
+        lines = queue.Queue()
+        stop = threading.Event()
+
+        def run_group(group):
+            memo = {}
+            for item in group:
+                if stop.is_set():
+                    return
+                result, status, error = _outcome(analyze, item, memo, error_types)
+                lines.put((item_line(item, result, status, error), error is not None))
+
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, len(groups)), thread_name_prefix="batch")
+        try:
+            futures = [pool.submit(run_group, group) for group in groups]
+            for _ in range(sum(len(group) for group in groups)):
+                line, is_error = lines.get()
+                failed += is_error
+                yield line
+            for future in futures:
+                future.result()
+        finally:
+            # A client that disconnects mid-stream stops the remaining work; analyses
+            # already running finish, but nothing new starts
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+    yield summary_line(items, groups, failed)
+
+
+async def run_batch_async(items, analyze, error_types=(), concurrency=BATCH_CONCURRENCY):
+    """Async generator of NDJSON lines, in completion order; analyze is a coroutine function"""
+    groups = group_items(items)
+    failed = 0
+    for item in items:
+        if item.error is not None:
+            failed += 1
+            yield item_line(item, status=400, error={"error": item.error})
+    lines = asyncio.Queue()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run_group(group):
+        async with limit:
+            memo = {}
+            for item in group:
+                key = item.fields_key
+                if key not in memo:
+                    try:
+                        memo[key] = await analyze(item.upload, item.description, item.type, item.severity), 200, None
+                    except Exception as e:
+                        memo[key] = _failure(item, e, error_types)
+                result, status, error = memo[key]
+                await lines.put((item_line(item, result, status, error), error is not None))
+
+    tasks = [asyncio.ensure_future(run_group(group)) for group in groups]
+    try:
+        for _ in range(sum(len(group) for group in groups)):
+            line, is_error = await lines.get()
+            failed += is_error
+            yield line
+    finally:
+        # A client that disconnects mid-stream stops the remaining work
+        for task in tasks:
+            task.cancel()
+    yield summary_line(items, groups, failed)
@@ -0,0 +1,93 @@
+"""Machine-readable benchmark results and the regression check against a baseline.
+
+micro.py and matrix.py write results as JSON:
+
+    {"kind": "micro", "meta": {...}, "results": {"<case>": {"<metric>": value, ...}, ...}}
+
+Saved under benchmarks/baselines/, a results file becomes the baseline that later
+runs are compared to. A case regresses when a latency or memory metric grows, or a
+throughput metric shrinks, by more than the tolerance; error rates are compared in
+absolute terms. Cases missing on either side are reported but don't fail.
+
+    python benchmarks/baseline.py benchmarks/baselines/matrix.json matrix-now.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+LOWER_IS_BETTER = ("p50", "p95", "p99", "mean_us", "p50_us", "p99_us", "mem_per_inflight_mb", "idle_rss_mb")
+HIGHER_IS_BETTER = ("throughput", "ok_throughput")
+# Absolute increase in error rate that counts as a regression
+ERROR_RATE_SLACK = 0.01
+
+
+def write_results(path, kind, results, **meta):
+    meta.setdefault("python", platform.python_version())
+    meta.setdefault("machine", platform.machine())
+    meta.setdefault("cpus", os.cpu_count())
+    meta.setdefault("timestamp", time.strftime("%Y-%m-%dT%H:%M:%S"))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"kind": kind, "meta": meta, "results": results}, f, indent=2, sort_keys=True)
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerance=0.1):
+    """[(case, metric, baseline_value, current_value)] for every regression"""
+    regressions = []
+    for case, base in baseline["results"].items():
+        now = current["results"].get(case)
+        if now is None:
+            continue
+        for metric, old in base.items():
+            new = now.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+                continue
+            if metric in LOWER_IS_BETTER and old > 0 and new > old * (1 + tolerance):
+                regressions.append((case, metric, old, new))
+            elif metric in HIGHER_IS_BETTER and new < old * (1 - tolerance):
+                regressions.append((case, metric, old, new))
+            elif metric == "error_rate" and new > old + ERROR_RATE_SLACK:
+                regressions.append((case, metric, old, new))
+    return regressions
+
+
+def report(baseline, current, tolerance=0.1):
+    """Print the comparison; returns True when nothing regressed"""
+    if baseline.get("kind") != current.get("kind"):
+        print(f"baseline is {baseline.get('kind')!r} results, current run is {current.get('kind')!r}")
+        return False
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    added = sorted(set(current["results"]) - set(baseline["results"]))
+    for case in missing:
+        print(f"  not run now:     {case}")
+    for case in added:
+        print(f"  no baseline for: {case}")
+    regressions = compare(baseline, current, tolerance)
+    for case, metric, old, new in regressions:
+        print(f"  REGRESSION {case} {metric}: {old:.4g} -> {new:.4g}")
+    print(f"{len(regressions)} regression(s) at {tolerance:.0%} tolerance")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    ok = report(read_results(args.baseline), read_results(args.current), args.tolerance)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Near-duplicate index lookup latency against index size.
+
+    python benchmarks/bench_phash.py --sizes 1000 10000 100000 300000 --distance 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phash import HASH_BITS, MultiIndexHash  # noqa: E402
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(size, distance, queries, rng):
+    index = MultiIndexHash()
+    stored = [rng.getrandbits(HASH_BITS) for _ in range(size)]
+    build_start = time.perf_counter()
+    for value in stored:
+        index.add(value)
+    build_s = time.perf_counter() - build_start
+
+    # Half the queries are near-duplicates of stored hashes, half are unseen photos
+    probes = []
+    for i in range(queries):
+        if i % 2 == 0:
+            probes.append(flip_bits(rng.choice(stored), rng.randint(0, distance), rng))
+        else:
+            probes.append(rng.getrandbits(HASH_BITS))
+
+    latencies = []
+    found = 0
+    for probe in probes:
+        start = time.perf_counter()
+        matches = index.search(probe, distance)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        found += bool(matches)
+
+    return {
+        "size": size,
+        "build_s": build_s,
+        "p50_us": statistics.median(latencies),
+        "p99_us": percentile(latencies, 99),
+        "max_us": max(latencies),
+        "hit_rate": found / queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 300_000])
+    parser.add_argument("--distance", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>9} {'build s':>8} {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'hit rate':>8}")
+    for size in args.sizes:
+        r = run(size, args.distance, args.queries, rng)
+        print(
+            f"{r['size']:>9} {r['build_s']:>8.2f} {r['p50_us']:>8.1f} "
+            f"{r['p99_us']:>8.1f} {r['max_us']:>8.1f} {r['hit_rate']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Concurrency check: N simultaneous identical submissions cost one analysis.
+
+Swaps in the fake model backend with a fixed delay, fires N identical
+requests through run_analysis (threads) and run_analysis_async (one event loop)
+at the same instant, and exits non-zero unless each mode invoked the image
+stage exactly once.
+
+    python benchmarks/coalescing_check.py -n 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+from backends import FakeBackend  # noqa: E402
+from cache import ResultCache  # noqa: E402
+from payloads import synth_image  # noqa: E402
+from phash import NearDuplicateIndex  # noqa: E402
+
+
+def reset(delay):
+    pipeline.backend = FakeBackend(latency=f"fixed:{delay}")
+    pipeline.result_cache = ResultCache(path=None)
+    pipeline.near_duplicates = NearDuplicateIndex(path=None)
+    pipeline.types_registry.push(["fire", "flood"])
+
+
+def run_threads(n, img_bytes):
+    barrier = threading.Barrier(n)
+    results = []
+
+    def submit():
+        barrier.wait()
+        results.append(pipeline.run_analysis(img_bytes, "fire", "fire", "High"))
+
+    threads = [threading.Thread(target=submit) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+async def run_tasks(n, img_bytes):
+    return await asyncio.gather(*(pipeline.run_analysis_async(img_bytes, "fire", "fire", "High") for _ in range(n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    img_bytes = synth_image(640, 480)
+    ok = True
+    for name, run in (("threads", lambda: run_threads(args.n, img_bytes)),
+                      ("asyncio", lambda: asyncio.run(run_tasks(args.n, img_bytes)))):
+        reset(args.delay)
+        before = pipeline.inflight.snapshot()
+        results = run()
+        after = pipeline.inflight.snapshot()
+        coalesced = after["inflight_coalesced"] - before["inflight_coalesced"]
+        image_calls = pipeline.backend.calls.get("image", 0)
+        same = all(r == results[0] for r in results)
+        print(f"{name}: {len(results)} requests, {image_calls} image-stage calls, {coalesced} coalesced, identical results: {same}")
+        ok = ok and image_calls == 1 and coalesced == args.n - 1 and same
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Side-by-side latency and agreement of the two-stage and fused analysis modes.
+
+The request set is a JSONL manifest, one recorded submission per line:
+
+    {"image": "samples/flood1.jpg", "description": "...", "type": "flood", "severity": "High"}
+
+Image paths are relative to the manifest. Caches are bypassed so every request
+reaches the model in both modes.
+
+    python benchmarks/compare_modes.py samples/manifest.jsonl --out compare.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+
+MODES = ("two_stage", "fused")
+
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def lookup(self, value, scope):
+        return None, None
+
+    def add(self, value, scope, payload):
+        pass
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def load_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                with open(os.path.join(base, item["image"]), "rb") as img:
+                    item["image_bytes"] = img.read()
+                yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest")
+    parser.add_argument("--out", help="write per-request results as JSONL")
+    args = parser.parse_args()
+
+    pipeline.result_cache = NoCache()
+    pipeline.near_duplicates = NoCache()
+    pipeline.types_registry.refresh()
+
+    rows = []
+    for item in load_manifest(args.manifest):
+        row = {"image": item["image"]}
+        for mode in MODES:
+            start = time.perf_counter()
+            try:
+                result = pipeline.run_analysis(
+                    item["image_bytes"], item.get("description", ""), item.get("type", ""), item.get("severity", ""), mode=mode
+                )
+            except pipeline.AnalysisError as e:
+                result = {"error": e.payload.get("error")}
+            row[mode] = {"latency": time.perf_counter() - start, **result}
+        rows.append(row)
+        print(f"{item['image']}: " + "  ".join(f"{m} {row[m]['latency']:.2f}s" for m in MODES))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+    print(f"\n{'mode':<10} {'p50 s':>8} {'p95 s':>8} {'mean s':>8} {'errors':>7}")
+    for mode in MODES:
+        latencies = [row[mode]["latency"] for row in rows]
+        errors = sum("error" in row[mode] for row in rows)
+        print(
+            f"{mode:<10} {statistics.median(latencies):>8.2f} {percentile(latencies, 95):>8.2f} "
+            f"{statistics.mean(latencies):>8.2f} {errors:>7}"
+        )
+
+    both = [row for row in rows if all("error" not in row[m] for m in MODES)]
+    if both:
+        a, b = MODES
+
+        def agree(field, normalize=lambda v: v):
+            return sum(normalize(row[a][field]) == normalize(row[b][field]) for row in both) / len(both)
+
+        print(f"\nagreement over {len(both)} requests")
+        print(f"  is_incident       {agree('is_incident'):.1%}")
+        print(f"  type              {agree('type', str.lower):.1%}")
+        print(f"  severity          {agree('severity', str.lower):.1%}")
+        print(f"  mean |d proba|    {statistics.mean(abs(row[a]['probability'] - row[b]['probability']) for row in both):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""How many model calls the pre-screen saves, at what false-reject rate.
+
+The labelled set is a directory with two sub-directories:
+
+    images/keep/     uploads that must reach the model (real incident photos, and
+                     genuine non-incident photos the model should judge)
+    images/reject/   blank frames, thumbnails, screenshots, photos of screens, cartoons
+
+Each image goes through the same decode/downscale as /analyze, then the
+pre-screen. A rejected "keep" image is a false reject; every rejected image
+saves the model calls of one analysis (2 in two_stage mode, 1 in fused).
+
+    python benchmarks/eval_prescreen.py images/
+    python benchmarks/eval_prescreen.py images/ --screen-check --sweep max_spectral_peak=20,30,45,60
+"""
+import argparse
+import dataclasses
+import io
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageOps  # noqa: E402
+
+from prescreen import ScreenConfig, screen  # noqa: E402
+from preprocess import target_size  # noqa: E402
+
+LABELS = ("keep", "reject")
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_set(root):
+    """[(label, name, image, original_size)], decoded and downscaled as prepare_image would"""
+    items = []
+    for label in LABELS:
+        folder = os.path.join(root, label)
+        if not os.path.isdir(folder):
+            raise SystemExit(f"missing {folder}")
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(EXTENSIONS):
+                continue
+            with open(os.path.join(folder, name), "rb") as f:
+                image = ImageOps.exif_transpose(Image.open(io.BytesIO(f.read())))
+            original_size = image.size
+            new_size = target_size(*original_size)
+            if new_size != original_size:
+                image = image.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+            items.append((label, name, image, original_size))
+    return items
+
+
+def evaluate(items, config, calls_per_analysis):
+    counts = {label: 0 for label in LABELS}
+    rejected = {label: 0 for label in LABELS}
+    reasons = {}
+    false_rejects = []
+    timings = []
+    for label, name, image, original_size in items:
+        result = screen(image, original_size, config)
+        counts[label] += 1
+        timings.append(result.elapsed_ms)
+        if result.reject:
+            rejected[label] += 1
+            reasons[result.reason] = reasons.get(result.reason, 0) + 1
+            if label == "keep":
+                false_rejects.append((name, result.reason, result.measures))
+    total = len(items)
+    return {
+        "images": total,
+        "rejected": sum(rejected.values()),
+        "calls_saved": sum(rejected.values()) * calls_per_analysis,
+        "calls_saved_share": sum(rejected.values()) / total if total else 0.0,
+        "false_reject_rate": rejected["keep"] / counts["keep"] if counts["keep"] else 0.0,
+        "reject_recall": rejected["reject"] / counts["reject"] if counts["reject"] else 0.0,
+        "reasons": reasons,
+        "false_rejects": false_rejects,
+        "p50_ms": statistics.median(timings) if timings else 0.0,
+        "max_ms": max(timings) if timings else 0.0,
+    }
+
+
+def print_result(label, r):
+    print(
+        f"{label:<36} {r['rejected']:>4}/{r['images']:<4} saved {r['calls_saved']:>5} calls ({r['calls_saved_share']:.1%})  "
+        f"false rejects {r['false_reject_rate']:.1%}  recall {r['reject_recall']:.1%}  "
+        f"p50 {r['p50_ms']:.1f} ms  max {r['max_ms']:.1f} ms  {r['reasons']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--screen-check", action="store_true", help="enable the screen-capture check (non-demo mode)")
+    parser.add_argument("--calls-per-analysis", type=int, default=2)
+    parser.add_argument("--sweep", action="append", default=[], help="field=v1,v2,... over a ScreenConfig threshold")
+    parser.add_argument("--show-false-rejects", action="store_true")
+    args = parser.parse_args()
+
+    items = load_set(args.root)
+    base = ScreenConfig(screen_check=args.screen_check or ScreenConfig().screen_check)
+
+    result = evaluate(items, base, args.calls_per_analysis)
+    print_result("current thresholds", result)
+    if args.show_false_rejects:
+        for name, reason, measures in result["false_rejects"]:
+            print(f"    {name}: {reason} {measures}")
+
+    fields = {f.name: f.type for f in dataclasses.fields(ScreenConfig)}
+    for sweep in args.sweep:
+        name, _, values = sweep.partition("=")
+        if name not in fields:
+            raise SystemExit(f"unknown threshold {name!r}; one of {', '.join(fields)}")
+        for value in values.split(","):
+            config = dataclasses.replace(base, **{name: type(getattr(base, name))(value)})
+            print_result(f"{name}={value}", evaluate(items, config, args.calls_per_analysis))
+
+
+if __name__ == "__main__":
+    main()
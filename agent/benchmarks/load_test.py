@@ -0,0 +1,158 @@
+"""Closed- and open-loop load test for /analyze, comparing serving modes side by side.
+
+Start each mode on its own port (MODEL_BACKEND=fake to take Gemini out of the
+picture), then point the script at both:
+
+    gunicorn -w 4 --threads 8 -b :5000 app:app
+    uvicorn asgi:app --port 5001
+    python benchmarks/load_test.py \
+        --target flask=http://localhost:5000 --target asgi=http://localhost:5001 \
+        --concurrency 100 --requests 1000 --unique
+
+Closed loop (default) keeps --concurrency requests in flight and measures what
+the service sustains. Open loop (--rate) sends Poisson arrivals at a fixed
+rate regardless of how fast replies come back, which is what exposes queueing:
+latency is measured from each request's scheduled send time, so a stalled
+server can't hide its backlog.
+
+Payloads are multipart image/description/type/severity submissions drawn from
+--image, --image-dir or synthesised photos (see payloads.py). --unique appends
+a nonce to every description so the result cache doesn't short-circuit the
+model calls.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from payloads import PayloadFactory, load_images  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies, statuses, elapsed):
+    ok = statuses.get(200, 0)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "ok_throughput": ok / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "error_rate": 1 - ok / len(latencies) if latencies else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+async def send(client, url, payloads):
+    files, data = payloads.next()
+    try:
+        response = await client.post(f"{url}/analyze", files=files, data=data)
+        return response.status_code
+    except httpx.HTTPError as e:
+        return type(e).__name__
+
+
+async def run_closed(url, payloads, concurrency, requests, timeout=120.0):
+    """`concurrency` clients each sending their next request as soon as the last returns"""
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker(client):
+        for _ in remaining:
+            start = time.perf_counter()
+            status = await send(client, url, payloads)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, statuses, elapsed)
+
+
+async def run_open(url, payloads, rate, duration, timeout=120.0, seed=0):
+    """Poisson arrivals at `rate` req/s for `duration` seconds, independent of completions"""
+    latencies = []
+    statuses = {}
+    rng = random.Random(seed)
+
+    async def one(client, scheduled):
+        status = await send(client, url, payloads)
+        latencies.append(time.perf_counter() - scheduled)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        scheduled = start
+        tasks = []
+        while scheduled - start < duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(client, scheduled)))
+            scheduled += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    result = summarize(latencies, statuses, elapsed)
+    result["offered_rate"] = rate
+    return result
+
+
+def build_payloads(args):
+    if args.image:
+        with open(args.image, "rb") as f:
+            images = [(os.path.basename(args.image), f.read(), "image/jpeg")]
+    else:
+        images = load_images(args.image_dir)
+    return PayloadFactory(images, unique=args.unique, seed=args.seed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=url, repeatable")
+    parser.add_argument("--image", help="send this one photo")
+    parser.add_argument("--image-dir", help="draw photos from this directory (default: synthesised)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rate", type=float, help="open loop: arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="open loop: seconds of arrivals")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--unique", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args)
+
+    print(f"{'target':<12} {'reqs':>6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}  statuses")
+    for target in args.target:
+        name, _, url = target.partition("=")
+        url = url.rstrip("/")
+        if args.rate:
+            r = await run_open(url, payloads, args.rate, args.duration, args.timeout, args.seed)
+        else:
+            r = await run_closed(url, payloads, args.concurrency, args.requests, args.timeout)
+        print(
+            f"{name:<12} {r['requests']:>6} {r['throughput']:>8.2f} {r['p50']:>8.3f} "
+            f"{r['p95']:>8.3f} {r['p99']:>8.3f}  {r['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,237 @@
+"""Throughput, latency and memory per in-flight request across serving configurations.
+
+For each configuration the service is started on a free port with the fake
+model backend (MODEL_BACKEND=fake), throwaway caches and the near-duplicate
+index disabled, so every request runs the full pipeline. Then:
+
+- closed-loop runs at each --concurrency give sustained req/s and p50/p95/p99
+- optional open-loop runs at each --rate show latency under a fixed offered load
+- the process tree's RSS is sampled during every run; memory per in-flight
+  request is (peak RSS - idle RSS) / concurrency
+
+    python benchmarks/matrix.py --out matrix-now.json
+    python benchmarks/matrix.py --config gunicorn:workers=2,threads=16 --config uvicorn:workers=2 \
+        --concurrency 16 64 --rate 20 --compare benchmarks/baselines/matrix.json
+
+Configurations are "gunicorn:workers=W,threads=T" (app.py) or
+"uvicorn:workers=W" (asgi.py). Fake latency is set with --fake-latency.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from baseline import read_results, report, write_results  # noqa: E402
+from load_test import run_closed, run_open  # noqa: E402
+from payloads import PayloadFactory, load_images  # noqa: E402
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIGS = (
+    "gunicorn:workers=1,threads=8",
+    "gunicorn:workers=1,threads=32",
+    "gunicorn:workers=2,threads=16",
+    "uvicorn:workers=1",
+    "uvicorn:workers=2",
+)
+
+
+def parse_config(spec):
+    server, _, params = spec.partition(":")
+    options = {"workers": 1, "threads": 8}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        options[key.strip()] = int(value)
+    if server not in ("gunicorn", "uvicorn"):
+        raise SystemExit(f"unknown server in {spec!r}")
+    return server, options
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def tree_pids(root):
+    """root and all its descendants, from /proc"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the ppid follows the closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(parents.get(pid, ()))
+    return pids
+
+
+def tree_rss_mb(root):
+    total_kb = 0
+    for pid in tree_pids(root):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class RssSampler:
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(server, options, port, env):
+    if server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(options["workers"]), "--threads", str(options["threads"]),
+               "-b", f"127.0.0.1:{port}", "--timeout", "120", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(options["workers"]), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=AGENT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{' '.join(cmd)} exited:\n{proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            if httpx.get(f"{url}/metrics", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"{' '.join(cmd)} did not come up")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def server_env(args, tmpdir):
+    env = dict(os.environ)
+    env.update({
+        "MODEL_BACKEND": "fake",
+        "FAKE_LATENCY": args.fake_latency,
+        "FAKE_ERROR_RATE": str(args.fake_error_rate),
+        "RESULT_CACHE_PATH": os.path.join(tmpdir, "results.sqlite3"),
+        "PHASH_INDEX_PATH": os.path.join(tmpdir, "phash.sqlite3"),
+        "PHASH_MAX_DISTANCE": "-1",
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def run_config(spec, args, payloads):
+    server, options = parse_config(spec)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        proc, url = start_server(server, options, free_port(), server_env(args, tmpdir))
+        try:
+            asyncio.run(run_closed(url, payloads, 4, args.warmup))
+            idle = tree_rss_mb(proc.pid)
+            for concurrency in args.concurrency:
+                with RssSampler(proc.pid) as rss:
+                    r = asyncio.run(run_closed(url, payloads, concurrency, max(args.requests, concurrency * 5)))
+                r["idle_rss_mb"] = idle
+                r["peak_rss_mb"] = rss.peak
+                r["mem_per_inflight_mb"] = max(0.0, rss.peak - idle) / concurrency
+                results[f"{spec}/c{concurrency}"] = r
+                print_row(f"{spec}/c{concurrency}", r)
+            for rate in args.rate or ():
+                with RssSampler(proc.pid) as rss:
+                    r = asyncio.run(run_open(url, payloads, rate, args.duration))
+                r["idle_rss_mb"] = idle
+                r["peak_rss_mb"] = rss.peak
+                results[f"{spec}/r{rate:g}"] = r
+                print_row(f"{spec}/r{rate:g}", r)
+        finally:
+            stop_server(proc)
+    return results
+
+
+def print_row(case, r):
+    per_inflight = r.get("mem_per_inflight_mb")
+    print(
+        f"{case:<44} {r['throughput']:>8.1f} {r['p50']:>7.3f} {r['p95']:>7.3f} {r['p99']:>7.3f} "
+        f"{r['error_rate']:>6.1%} {r['peak_rss_mb']:>8.0f} "
+        + (f"{per_inflight:>9.2f}" if per_inflight is not None else f"{'-':>9}"),
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", help="server configuration, repeatable")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--requests", type=int, default=300, help="closed loop: requests per run (at least 5x concurrency)")
+    parser.add_argument("--rate", type=float, nargs="*", help="open loop: offered req/s, one run each")
+    parser.add_argument("--duration", type=float, default=20.0, help="open loop: seconds per run")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--image-dir", help="draw photos from this directory (default: synthesised)")
+    parser.add_argument("--fake-latency", default="lognormal:0.8,0.35")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline JSON to check against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    payloads = PayloadFactory(load_images(args.image_dir), unique=True)
+    configs = args.config or DEFAULT_CONFIGS
+
+    print(f"{'case':<44} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>6} {'peak MB':>8} {'MB/req':>9}")
+    results = {}
+    for spec in configs:
+        results.update(run_config(spec, args, payloads))
+
+    if args.out:
+        write_results(args.out, "matrix", results, fake_latency=args.fake_latency, configs=list(configs))
+    if args.compare:
+        ok = report(read_results(args.compare), {"kind": "matrix", "results": results}, args.tolerance)
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Micro-benchmarks for the CPU work around the model calls.
+
+Times image preprocessing at typical upload sizes, prompt assembly, and
+response parsing/validation, in-process with the fake model backend and no
+disk caches.
+
+    python benchmarks/micro.py --out micro-now.json
+    python benchmarks/micro.py --compare benchmarks/baselines/micro.json
+    python benchmarks/micro.py --out benchmarks/baselines/micro.json   # accept as the new baseline
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+os.environ.setdefault("PHASH_INDEX_PATH", "")
+
+from PIL import Image  # noqa: E402
+
+import pipeline  # noqa: E402
+from baseline import read_results, report, write_results  # noqa: E402
+from payloads import synth_image  # noqa: E402
+from preprocess import prepare_image  # noqa: E402
+from prescreen import ScreenConfig, screen  # noqa: E402
+from prompts import compile_prompts  # noqa: E402
+from similarity import description_score  # noqa: E402
+from types_registry import types_version  # noqa: E402
+
+TYPES = ("fire", "flood", "earthquake", "accident", "landslide", "storm", "other")
+
+IMAGE_REPLY = json.dumps({
+    "disaster_probability": 0.82, "disaster_type": "fire", "disaster_severity": "High",
+    "reasoning": "Thick smoke rises from the upper floors of a residential building while people gather below.",
+})
+DESC_REPLY = json.dumps({
+    "description_similarity_score": 0.9,
+    "reformulated_description": "A fire is spreading through a residential building, sending thick smoke into the sky.",
+})
+FUSED_REPLY = json.dumps({**json.loads(IMAGE_REPLY), **json.loads(DESC_REPLY)})
+
+
+def measure(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.mean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def cases(scale):
+    version = types_version(TYPES)
+    prompts = compile_prompts(TYPES, version)
+    uploads = {name: synth_image(w, h) for name, (w, h) in
+               {"4032x3024": (4032, 3024), "1280x960": (1280, 960), "640x480": (640, 480)}.items()}
+    prepared = prepare_image(uploads["1280x960"])
+    decoded = Image.open(io.BytesIO(uploads["1280x960"]))
+    decoded.load()
+    screen_config = ScreenConfig(screen_check=True)
+
+    def compile_cold():
+        compile_prompts.cache_clear()
+        compile_prompts(TYPES, version)
+
+    image_result = pipeline.parse_image_output(IMAGE_REPLY)
+    desc_result = pipeline.parse_desc_output(DESC_REPLY)
+
+    yield "preprocess/prepare_4032x3024", lambda: prepare_image(uploads["4032x3024"]), 20 * scale
+    yield "preprocess/prepare_1280x960", lambda: prepare_image(uploads["1280x960"]), 50 * scale
+    yield "preprocess/prepare_640x480", lambda: prepare_image(uploads["640x480"]), 100 * scale
+    yield "prescreen/screen_1280x960", lambda: screen(decoded, decoded.size, screen_config), 200 * scale
+    yield "prompts/compile_cold", compile_cold, 1000 * scale
+    yield "prompts/compile_warm", lambda: compile_prompts(TYPES, version), 10000 * scale
+    yield "prompts/image_call", lambda: pipeline.image_call(prepared, "fire", "High", prompts), 10000 * scale
+    yield "prompts/desc_call", lambda: pipeline.desc_call("Smoke everywhere", image_result.reasoning, prompts), 10000 * scale
+    yield "prompts/fused_call", lambda: pipeline.fused_call(prepared, "Smoke everywhere", "fire", "High", prompts), 10000 * scale
+    yield "parse/image_output", lambda: pipeline.parse_image_output(IMAGE_REPLY), 10000 * scale
+    yield "parse/image_output_fenced", lambda: pipeline.parse_image_output(f"```json\n{IMAGE_REPLY}\n```"), 10000 * scale
+    yield "parse/desc_output", lambda: pipeline.parse_desc_output(DESC_REPLY), 10000 * scale
+    yield "parse/fused_output", lambda: pipeline.parse_fused_output(FUSED_REPLY), 10000 * scale
+    yield "parse/combine", lambda: pipeline.combine(image_result, desc_result, False), 10000 * scale
+    yield "similarity/description_score", lambda: description_score(
+        "Smoke everywhere, the building on the corner is on fire", image_result.reasoning, "fire"), 10000 * scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    parser.add_argument("--only", help="run cases whose name contains this")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline JSON to check against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<34} {'iters':>7} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name, fn, iterations in cases(args.scale):
+        if args.only and args.only not in name:
+            continue
+        r = measure(fn, max(1, int(iterations)))
+        results[name] = r
+        print(f"{name:<34} {r['iterations']:>7} {r['mean_us']:>10.1f} {r['p50_us']:>10.1f} {r['p99_us']:>10.1f}")
+
+    if args.out:
+        write_results(args.out, "micro", results)
+    if args.compare:
+        ok = report(read_results(args.compare), {"kind": "micro", "results": results}, args.tolerance)
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Realistic /analyze submissions for the benchmarks.
+
+Images are either read from a directory of real photos or synthesised at
+typical phone/camera resolutions, with noise so they compress like photos
+rather than flat colour. Form fields are drawn from a small pool of plausible
+reports, a fifth of them without a description, as the frontend allows.
+"""
+import io
+import os
+import random
+import uuid
+
+from PIL import Image
+
+SIZES = ((4032, 3024), (1920, 1080), (1280, 960), (800, 600))
+TYPES = ("fire", "flood", "earthquake", "accident", "other")
+SEVERITIES = ("Low", "Medium", "High")
+DESCRIPTIONS = (
+    "Fire spreading through a residential building, heavy smoke on the upper floors",
+    "Street flooded after the storm, cars stuck in water up to the doors",
+    "Two cars collided at the intersection, one person looks injured",
+    "Cracks in the walls and debris on the road after the tremor",
+    "Small brush fire next to the highway, firefighters not here yet",
+    "Water coming into the ground floor shops, people moving goods out",
+    "",
+)
+
+
+def synth_image(width, height, seed=0, quality=90):
+    """A JPEG with a gradient and sensor-like noise, sized like a real upload"""
+    rng = random.Random(seed)
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    tint = Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    img = Image.blend(Image.blend(base, tint, 0.4), noise, 0.3)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def load_images(image_dir=None, sizes=SIZES, per_size=2):
+    """[(filename, bytes, mime_type)] from image_dir, or synthesised when it is None"""
+    images = []
+    if image_dir:
+        for name in sorted(os.listdir(image_dir)):
+            ext = os.path.splitext(name)[1].lower()
+            mime = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}.get(ext)
+            if mime:
+                with open(os.path.join(image_dir, name), "rb") as f:
+                    images.append((name, f.read(), mime))
+        if not images:
+            raise SystemExit(f"no images in {image_dir}")
+        return images
+    for width, height in sizes:
+        for i in range(per_size):
+            images.append((f"synth_{width}x{height}_{i}.jpg", synth_image(width, height, seed=i), "image/jpeg"))
+    return images
+
+
+class PayloadFactory:
+    """Multipart bodies for httpx: next() returns (files, data)"""
+
+    def __init__(self, images, unique=True, seed=0):
+        self.images = images
+        self.unique = unique
+        self.rng = random.Random(seed)
+
+    def next(self):
+        name, data, mime = self.rng.choice(self.images)
+        description = self.rng.choice(DESCRIPTIONS)
+        if self.unique:
+            # Defeats the result cache so every request reaches the model
+            description = f"{description} [{uuid.uuid4().hex[:8]}]".strip()
+        form = {"description": description, "type": self.rng.choice(TYPES), "severity": self.rng.choice(SEVERITIES)}
+        return {"image": (name, data, mime)}, form
@@ -0,0 +1,129 @@
+"""Token accounting and the adaptive image budget, in process with the fake backend.
+
+Sends waves of distinct 3 MP photos through run_analysis. The fake backend
+bills each image by its downscaled size and adds --per-1k seconds per 1000
+prompt tokens. The script reports tokens, cost, image tokens and model time
+per analysis, first one at a time and then --concurrency at once.
+
+    python benchmarks/token_budget.py
+    python benchmarks/token_budget.py --token-budget 3000 --latency-budget 2.5 --load 8 --concurrency 32
+
+Exits 1 when analyses run one at a time go over the token budget or
+the latency budget (median model time, once the policy has settled),
+or when the loaded wave does not send smaller images than the sequential one.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+import pipeline  # noqa: E402
+from backends import FakeBackend  # noqa: E402
+from budget import ResolutionPolicy  # noqa: E402
+from cache import ResultCache  # noqa: E402
+from phash import NearDuplicateIndex  # noqa: E402
+from preprocess import IMAGE_TOKEN_BUDGET, TOKENS_PER_TILE  # noqa: E402
+
+
+def distinct_image(seed, width=2016, height=1512):
+    """A JPEG whose coarse structure, and so its perceptual hash, differs per seed"""
+    rng = random.Random(seed)
+    blocks = Image.frombytes("RGB", (16, 12), rng.randbytes(16 * 12 * 3))
+    buffer = io.BytesIO()
+    blocks.resize((width, height), Image.BILINEAR).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class RecordingPolicy(ResolutionPolicy):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.usages = []
+
+    def release(self, usage):
+        super().release(usage)
+        self.usages.append(usage)
+
+
+def run_wave(images, concurrency):
+    barrier = threading.Barrier(concurrency)
+
+    def submit(batch):
+        barrier.wait()
+        for img_bytes in batch:
+            pipeline.run_analysis(img_bytes, "Flames and smoke over the roofs", "fire", "High")
+
+    threads = [threading.Thread(target=submit, args=(images[i::concurrency],)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def summarise(usages):
+    return {
+        "analyses": len(usages),
+        "tokens": statistics.mean(u.total for u in usages),
+        "max_tokens": max(u.total for u in usages),
+        "cost_usd": statistics.mean(u.cost for u in usages),
+        "image_tokens": statistics.mean(u.image_tokens for u in usages),
+        "model_seconds": statistics.median(u.model_seconds for u in usages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=40, help="analyses per wave")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-tokens", type=int, default=IMAGE_TOKEN_BUDGET, help="IMAGE_TOKEN_BUDGET")
+    parser.add_argument("--token-budget", type=int, default=0, help="REQUEST_TOKEN_BUDGET")
+    parser.add_argument("--latency-budget", type=float, default=0.0, help="REQUEST_LATENCY_BUDGET")
+    parser.add_argument("--load", type=int, default=8, help="IMAGE_BUDGET_LOAD")
+    parser.add_argument("--delay", type=float, default=0.2, help="fixed fake latency per call")
+    parser.add_argument("--per-1k", type=float, default=0.3, help="fake latency per 1000 prompt tokens")
+    args = parser.parse_args()
+
+    pipeline.backend = FakeBackend(latency=f"fixed:{args.delay}", latency_per_1k_tokens=args.per_1k)
+    pipeline.result_cache = ResultCache(path=None)
+    pipeline.near_duplicates = NearDuplicateIndex(path=None)
+    pipeline.types_registry.push(["fire", "flood"])
+    policy = pipeline.resolution = RecordingPolicy(
+        max_tokens=args.max_tokens, token_budget=args.token_budget, latency_budget=args.latency_budget,
+        load=args.load)
+
+    ok = True
+    results = {}
+    print(f"{'wave':<12} {'n':>4} {'tokens':>7} {'max':>6} {'cost $':>9} {'img tok':>7} {'p50 s':>6}")
+    for wave, concurrency, seed in (("sequential", 1, 0), ("loaded", args.concurrency, 1000)):
+        images = [distinct_image(seed + i) for i in range(args.n)]
+        del policy.usages[:]
+        run_wave(images, concurrency)
+        # The first analyses teach the policy the prompt overhead and latency; judge the rest
+        r = results[wave] = summarise(policy.usages[args.n // 2:])
+        print(f"{wave:<12} {r['analyses']:>4} {r['tokens']:>7.0f} {r['max_tokens']:>6} {r['cost_usd']:>9.6f} "
+              f"{r['image_tokens']:>7.0f} {r['model_seconds']:>6.2f}")
+    print(f"policy: {policy.snapshot()}")
+
+    sequential, loaded = results["sequential"], results["loaded"]
+    if args.token_budget and sequential["max_tokens"] > args.token_budget:
+        print(f"FAIL: an analysis used {sequential['max_tokens']} tokens, over the {args.token_budget} budget")
+        ok = False
+    if args.latency_budget and sequential["model_seconds"] > args.latency_budget:
+        print(f"FAIL: median model time {sequential['model_seconds']:.2f}s is over the {args.latency_budget}s budget")
+        ok = False
+    # Nothing to tighten once the other limits are down to a single tile
+    if args.load and args.concurrency > args.load and sequential["image_tokens"] > TOKENS_PER_TILE \
+            and loaded["image_tokens"] >= sequential["image_tokens"]:
+        print("FAIL: the loaded wave did not send smaller images")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
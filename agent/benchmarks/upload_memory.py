@@ -0,0 +1,134 @@
+"""Peak RSS per in-flight upload, and the 413 size limit, against a running server.
+
+Starts each configuration as matrix.py does (fake model backend, throwaway
+caches), with a fixed fake latency long enough that a whole wave of
+--concurrency large uploads is in flight at once. Memory per in-flight
+request is (peak RSS of the process tree - idle RSS) / concurrency.
+
+It then checks that a body over MAX_CONTENT_LENGTH is refused with 413, both
+with a Content-Length (before the body is read) and chunked (once the limit
+is passed).
+
+    python benchmarks/upload_memory.py
+    python benchmarks/upload_memory.py --config uvicorn:workers=1 --concurrency 32 --max-mb-per-request 6
+
+Exits 1 when a 413 check fails or memory per request is over --max-mb-per-request.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from baseline import write_results  # noqa: E402
+from load_test import run_closed  # noqa: E402
+from matrix import RssSampler, free_port, parse_config, server_env, start_server, stop_server, tree_rss_mb  # noqa: E402
+from payloads import PayloadFactory, synth_image  # noqa: E402
+
+DEFAULT_CONFIGS = ("gunicorn:workers=1,threads=32", "uvicorn:workers=1")
+
+
+def oversize_body(size):
+    """A well-formed multipart /analyze body whose image part makes it `size` bytes or more"""
+    boundary = "upload-memory-check"
+    head = "".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in (("description", ""), ("type", "fire"), ("severity", "High"))
+    )
+    head += f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="big.jpg"\r\n' \
+            f"Content-Type: image/jpeg\r\n\r\n"
+    tail = f"\r\n--{boundary}--\r\n"
+    body = head.encode() + b"\0" * max(0, size - len(head) - len(tail)) + tail.encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def oversize_checks(url, limit):
+    """{name: (status, seconds)} for an over-limit body sent with and without a Content-Length"""
+    body, content_type = oversize_body(limit + 1)
+    results = {}
+    with httpx.Client(timeout=60) as client:
+        for name, content in (("content_length", body), ("chunked", None)):
+            if content is None:
+                # A generator body goes out with Transfer-Encoding: chunked
+                content = (body[offset:offset + (1 << 20)] for offset in range(0, len(body), 1 << 20))
+            start = time.perf_counter()
+            try:
+                status = client.post(f"{url}/analyze", content=content, headers={"Content-Type": content_type}).status_code
+            except httpx.HTTPError:
+                # The server may close the connection as soon as it has answered
+                status = "closed"
+            results[name] = (status, time.perf_counter() - start)
+    return results
+
+
+def run_config(spec, args, payloads):
+    server, options = parse_config(spec)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = server_env(args, tmpdir)
+        env["MAX_CONTENT_LENGTH"] = str(args.limit)
+        proc, url = start_server(server, options, free_port(), env)
+        try:
+            asyncio.run(run_closed(url, payloads, 2, 4))
+            idle = tree_rss_mb(proc.pid)
+            with RssSampler(proc.pid, interval=0.02) as rss:
+                r = asyncio.run(run_closed(url, payloads, args.concurrency, args.concurrency))
+            r["idle_rss_mb"] = idle
+            r["peak_rss_mb"] = rss.peak
+            r["mem_per_inflight_mb"] = max(0.0, rss.peak - idle) / args.concurrency
+            r["oversize"] = oversize_checks(url, args.limit)
+        finally:
+            stop_server(proc)
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", help="server configuration, as in matrix.py; repeatable")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--quality", type=int, default=97, help="JPEG quality of the synthesised upload")
+    parser.add_argument("--limit", type=int, default=16 * 1024 * 1024, help="MAX_CONTENT_LENGTH for the server")
+    parser.add_argument("--fake-latency", default="fixed:3")
+    parser.add_argument("--max-mb-per-request", type=float, help="fail when memory per in-flight request is higher")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    args.fake_error_rate = 0.0
+
+    upload = synth_image(args.width, args.height, seed=1, quality=args.quality)
+    print(f"upload: {args.width}x{args.height} JPEG, {len(upload) / 1e6:.1f} MB; {args.concurrency} in flight")
+    payloads = PayloadFactory([("upload.jpg", upload, "image/jpeg")], unique=True)
+
+    ok = True
+    results = {}
+    print(f"{'config':<32} {'idle MB':>8} {'peak MB':>8} {'MB/req':>7} {'errors':>6}  413 checks")
+    for spec in args.config or DEFAULT_CONFIGS:
+        r = run_config(spec, args, payloads)
+        results[spec] = r
+        checks = "  ".join(f"{name}={status} ({seconds:.2f}s)" for name, (status, seconds) in r["oversize"].items())
+        print(f"{spec:<32} {r['idle_rss_mb']:>8.0f} {r['peak_rss_mb']:>8.0f} {r['mem_per_inflight_mb']:>7.2f} "
+              f"{r['error_rate']:>6.1%}  {checks}")
+        if any(status not in (413, "closed") for status, _ in r["oversize"].values()):
+            print(f"  FAIL: {spec} did not refuse an oversized body with 413")
+            ok = False
+        if args.max_mb_per_request is not None and r["mem_per_inflight_mb"] > args.max_mb_per_request:
+            print(f"  FAIL: {spec} uses {r['mem_per_inflight_mb']:.2f} MB per in-flight request")
+            ok = False
+        if r["error_rate"] > 0:
+            print(f"  FAIL: {spec} answered {r['error_rate']:.1%} of uploads with errors")
+            ok = False
+
+    if args.out:
+        write_results(args.out, "upload_memory", {
+            spec: {k: v for k, v in r.items() if k != "oversize"} for spec, r in results.items()
+        }, concurrency=args.concurrency, upload_bytes=len(upload))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Token and cost accounting per analysis, and the adaptive image resolution policy.
+
+Every model reply carries usage metadata. Each call is recorded in
+agent_model_tokens{stage,kind,demo,context_cache} and
+agent_model_cost_usd_total. Each analysis adds up its calls into
+agent_request_tokens{kind,cache,demo} and the analysis_done log. Cost uses the
+MODEL_PRICE_* rates, in USD per million tokens.
+
+The image is the one input whose size this agent controls. ResolutionPolicy
+picks the image token budget that prepare_image downscales to, from the tiers
+between one tile and IMAGE_TOKEN_BUDGET. Three limits can lower it:
+
+- REQUEST_TOKEN_BUDGET: tokens per analysis across both stages. The image gets
+  what is left after the prompts and replies, going by recent analyses.
+- REQUEST_LATENCY_BUDGET: seconds of model time per analysis. The policy drops
+  a tier after an analysis over budget, and moves back up after
+  LATENCY_STEP_UP analyses in a row with room to spare.
+- IMAGE_BUDGET_LOAD: analyses in flight in this process. Past that point, the
+  budget shrinks in proportion to the excess, so a busy replica sends smaller
+  images instead of queueing.
+
+Set any of them to 0 to turn that limit off.
+"""
+import os
+import threading
+
+from metrics import usage_counts
+from preprocess import IMAGE_TOKEN_BUDGET, TOKENS_PER_TILE
+
+# USD per million tokens; the defaults are gemini-2.5-flash list prices, set them for your model and tier
+MODEL_PRICE_INPUT = float(os.getenv("MODEL_PRICE_INPUT", "0.30"))
+MODEL_PRICE_OUTPUT = float(os.getenv("MODEL_PRICE_OUTPUT", "2.50"))
+MODEL_PRICE_CACHED = float(os.getenv("MODEL_PRICE_CACHED", "0.075"))
+
+REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "0"))
+REQUEST_LATENCY_BUDGET = float(os.getenv("REQUEST_LATENCY_BUDGET", "0"))
+IMAGE_BUDGET_LOAD = int(os.getenv("IMAGE_BUDGET_LOAD", "16"))
+LATENCY_STEP_UP = int(os.getenv("LATENCY_STEP_UP", "10"))
+# An analysis "has room" to step up when it used less than this share of the latency budget
+LATENCY_HEADROOM = 0.75
+# Weight of the newest analysis in the prompt-and-reply overhead estimate
+OVERHEAD_ALPHA = 0.2
+
+# Tile counts that give distinct downscaled sizes for common aspect ratios
+TILE_COUNTS = (1, 2, 4, 6, 9, 12, 16, 20, 25)
+
+
+def model_cost(counts):
+    """USD for one call's {kind: tokens}; cached prompt tokens are billed at the cached rate"""
+    cached = counts.get("cached", 0)
+    prompt = counts.get("prompt", 0)
+    # Thinking tokens are billed as output; they are in the total but not in candidates_token_count
+    output = counts["total"] - prompt if "total" in counts else counts.get("output", 0)
+    return ((prompt - cached) * MODEL_PRICE_INPUT + cached * MODEL_PRICE_CACHED + output * MODEL_PRICE_OUTPUT) / 1e6
+
+
+class RequestUsage:
+    """Tokens, cost and model time of one analysis, added up over its model calls"""
+
+    def __init__(self, image_budget=None, level=None):
+        self.image_budget = image_budget
+        self.level = level
+        self.image_tokens = 0
+        self.tokens = {}
+        self.cost = 0.0
+        self.model_seconds = 0.0
+        self.calls = 0
+
+    def add(self, response, seconds):
+        counts = usage_counts(response)
+        for kind, value in counts.items():
+            self.tokens[kind] = self.tokens.get(kind, 0) + value
+        self.cost += model_cost(counts)
+        self.model_seconds += seconds
+        self.calls += 1
+
+    @property
+    def total(self):
+        return self.tokens.get("total", 0)
+
+    def log_fields(self):
+        fields = {f"tokens_{kind}": value for kind, value in self.tokens.items()}
+        if self.calls:
+            fields.update(cost_usd=round(self.cost, 6), model_seconds=round(self.model_seconds, 3))
+        if self.image_budget is not None:
+            fields.update(image_budget=self.image_budget, image_tokens=self.image_tokens)
+        return fields
+
+
+class ResolutionPolicy:
+    """Picks the image token budget for each analysis; see the module docstring"""
+
+    def __init__(self, max_tokens=IMAGE_TOKEN_BUDGET, token_budget=REQUEST_TOKEN_BUDGET,
+                 latency_budget=REQUEST_LATENCY_BUDGET, load=IMAGE_BUDGET_LOAD, step_up=LATENCY_STEP_UP):
+        self.tiers = [TOKENS_PER_TILE * n for n in TILE_COUNTS if TOKENS_PER_TILE * n < max_tokens]
+        self.tiers.append(max(max_tokens, TOKENS_PER_TILE))
+        self.token_budget = token_budget
+        self.latency_budget = latency_budget
+        self.load = load
+        self.step_up = step_up
+        self.level = len(self.tiers) - 1
+        self.overhead = None
+        self.active = 0
+        self._good = 0
+        self._lock = threading.Lock()
+        self.stats = {"budget_tightened_tokens": 0, "budget_tightened_load": 0,
+                      "latency_steps_down": 0, "latency_steps_up": 0}
+
+    def _tier_at_most(self, tokens):
+        fitting = [tier for tier in self.tiers if tier <= tokens]
+        return fitting[-1] if fitting else self.tiers[0]
+
+    def acquire(self):
+        """Admit one analysis; returns its RequestUsage, carrying the image budget to prepare with"""
+        with self._lock:
+            self.active += 1
+            budget = self.tiers[self.level]
+            if self.token_budget and self.overhead is not None and self.token_budget - self.overhead < budget:
+                budget = self._tier_at_most(self.token_budget - self.overhead)
+                self.stats["budget_tightened_tokens"] += 1
+            if self.load and self.active > self.load:
+                budget = self._tier_at_most(budget * self.load / self.active)
+                self.stats["budget_tightened_load"] += 1
+            return RequestUsage(budget, self.level)
+
+    def release(self, usage):
+        """Done with an analysis; learns from its usage when it reached the model"""
+        with self._lock:
+            self.active -= 1
+            if not usage.calls:
+                return
+            if usage.image_tokens:
+                overhead = usage.total - usage.image_tokens
+                self.overhead = overhead if self.overhead is None else \
+                    self.overhead + OVERHEAD_ALPHA * (overhead - self.overhead)
+            # Only analyses admitted at the current tier move it, so a burst of slow
+            # replies steps down once rather than once per reply
+            if not self.latency_budget or usage.level != self.level or not usage.image_tokens:
+                return
+            if usage.model_seconds > self.latency_budget:
+                self._good = 0
+                if self.level > 0:
+                    self.level -= 1
+                    self.stats["latency_steps_down"] += 1
+            elif usage.model_seconds < self.latency_budget * LATENCY_HEADROOM:
+                self._good += 1
+                if self._good >= self.step_up and self.level < len(self.tiers) - 1:
+                    self._good = 0
+                    self.level += 1
+                    self.stats["latency_steps_up"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["tier_tokens"] = self.tiers[self.level]
+            stats["active"] = self.active
+            if self.overhead is not None:
+                stats["overhead_tokens"] = round(self.overhead)
+        return stats
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+
+from logs import get_logger
+
+log = get_logger("cache")
+
+
+def normalize_field(value):
+    """Lowercase and collapse whitespace so trivially different forms share a key"""
+    return " ".join((value or "").split()).lower()
+
+
+def make_cache_key(img_digest, description, input_type, severity, prompt_scope):
+    """Key on the image hash, the normalized form fields and the prompts they were judged with"""
+    payload = json.dumps(
+        [
+            img_digest,
+            normalize_field(description),
+            normalize_field(input_type),
+            normalize_field(severity),
+            prompt_scope,
+        ],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """Per-process LRU with a TTL on every entry"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, False
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None, True
+            self._data.move_to_end(key)
+            return value, False
+
+    def set(self, key, value, expires_at=None):
+        """Store for a full TTL, or until `expires_at` when the entry already has an expiry elsewhere"""
+        evicted = 0
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl if expires_at is None else expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteFile:
+    """One SQLite file shared by every gunicorn worker on the host: its directory,
+    schema, per-thread connections and when to trim"""
+
+    # Trimming scans the table, so callers only do it every TRIM_EVERY writes
+    TRIM_EVERY = 64
+
+    def __init__(self, path, schema):
+        self.path = path
+        self._local = threading.local()
+        self._writes = count(1)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self.conn()
+        for statement in schema:
+            conn.execute(statement)
+        conn.commit()
+
+    def conn(self):
+        # sqlite connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def wrote(self):
+        """Count one write; True when it is time to trim"""
+        return next(self._writes) % self.TRIM_EVERY == 0
+
+
+class DiskTier:
+    """SQLite store shared by every gunicorn worker on the host; survives restarts"""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db = SqliteFile(path, (
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)",
+        ))
+
+    def get(self, key):
+        """(value, expires_at, expired) for a key; value is None on a miss"""
+        conn = self.db.conn()
+        row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None, False
+        value, expires_at = row
+        now = time.time()
+        if expires_at < now:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None, None, True
+        conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return json.loads(value), expires_at, False
+
+    def set(self, key, value):
+        conn = self.db.conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now),
+        )
+        conn.commit()
+        return self._trim(conn, now) if self.db.wrote() else 0
+
+    def _trim(self, conn, now):
+        evicted = conn.execute("DELETE FROM results WHERE expires_at < ?", (now,)).rowcount
+        evicted += conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        conn.commit()
+        return evicted
+
+
+class ResultCache:
+    """Two-tier cache for analysis results: in-process LRU in front of a shared SQLite file"""
+
+    def __init__(self, memory_entries=1024, disk_entries=100_000, ttl=3600, path=None):
+        self.memory = MemoryTier(memory_entries, ttl)
+        self.disk = DiskTier(path, disk_entries, ttl) if path else None
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+    def _count(self, name, amount=1):
+        if amount:
+            with self._lock:
+                self.stats[name] += amount
+
+    def get(self, key):
+        value, expired = self.memory.get(key)
+        self._count("expired", int(expired))
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        if self.disk is not None:
+            try:
+                value, expires_at, expired = self.disk.get(key)
+            except sqlite3.Error as e:
+                log.error("result_cache_read_failed", error=str(e))
+                self._count("disk_errors")
+                value, expires_at, expired = None, None, False
+            self._count("expired", int(expired))
+            if value is not None:
+                self._count("disk_hits")
+                # Keep the disk entry's expiry, so a promoted verdict doesn't outlive it
+                self._count("memory_evictions", self.memory.set(key, value, expires_at))
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self._count("memory_evictions", self.memory.set(key, value))
+        if self.disk is not None:
+            try:
+                self._count("disk_evictions", self.disk.set(key, value))
+            except sqlite3.Error as e:
+                log.error("result_cache_write_failed", error=str(e))
+                self._count("disk_errors")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+def cache_from_env():
+    return ResultCache(
+        memory_entries=int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "1024")),
+        disk_entries=int(os.getenv("RESULT_CACHE_DISK_ENTRIES", "100000")),
+        ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+        path=os.getenv("RESULT_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "results.sqlite3")) or None,
+    )
@@ -0,0 +1,146 @@
+"""Bounded in-process job queue behind the asynchronous /analyze mode.
+
+Jobs live in the memory of the process that accepted them, so job mode
+expects a single worker process (scale with threads) or sticky routing on
+the job id.
+"""
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+
+from logs import get_logger
+
+log = get_logger("jobs")
+
+# Lower runs first; anything unrecognised goes after Low
+SEVERITY_PRIORITY = {"high": 0, "medium": 1, "low": 2}
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, fn, args):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        data = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    def __init__(self, workers=4, max_pending=64, result_ttl=600.0, error_types=()):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        # Exceptions carrying .payload/.status, reported as-is instead of as a generic failure
+        self.error_types = tuple(error_types)
+        self._queue = queue.PriorityQueue(maxsize=max_pending)
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._avg_duration = 5.0
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def retry_after(self):
+        """Seconds until roughly one queue slot should free up"""
+        # With every worker busy a job finishes, and a queued one starts, every avg/workers seconds
+        return max(1, math.ceil(self._avg_duration / max(1, self.workers)))
+
+    def submit(self, fn, args, severity=""):
+        job = Job(fn, args)
+        priority = SEVERITY_PRIORITY.get((severity or "").strip().lower(), len(SEVERITY_PRIORITY))
+        with self._cond:
+            self._purge()
+            try:
+                # The sequence number keeps FIFO order within a priority and avoids comparing jobs
+                self._queue.put_nowait((priority, next(self._seq), job))
+            except queue.Full:
+                self.stats["rejected"] += 1
+                raise QueueFull(self.retry_after())
+            self._jobs[job.id] = job
+            self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id, wait=0.0):
+        """Look up a job, blocking up to `wait` seconds for it to finish"""
+        deadline = time.monotonic() + wait
+        with self._cond:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._cond:
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                result = job.fn(*job.args)
+                status, error, error_status = "done", None, None
+            except self.error_types as e:
+                result, status, error, error_status = None, "failed", e.payload, e.status
+            except Exception as e:
+                log.error("job_failed", job_id=job.id, error=str(e), exc_info=True)
+                result, status, error, error_status = None, "failed", {"error": "Analysis failed", "details": str(e)}, 500
+            with self._cond:
+                job.result, job.status, job.error, job.error_status = result, status, error, error_status
+                job.finished_at = time.time()
+                job.fn = job.args = None
+                self.stats["completed" if status == "done" else "failed"] += 1
+                duration = job.finished_at - job.started_at
+                self._avg_duration = 0.9 * self._avg_duration + 0.1 * duration
+                self._cond.notify_all()
+            self._queue.task_done()
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["pending"] = self._queue.qsize()
+            stats["tracked"] = len(self._jobs)
+        return stats
+
+
+def job_queue_from_env(error_types=()):
+    return JobQueue(
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_pending=int(os.getenv("JOB_QUEUE_SIZE", "64")),
+        result_ttl=float(os.getenv("JOB_RESULT_TTL", "600")),
+        error_types=error_types,
+    )
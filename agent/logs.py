@@ -0,0 +1,71 @@
+"""Leveled JSON logs with sampling for per-request events.
+
+    log = get_logger(__name__)
+    log.info("types_refreshed", count=12)
+    log.sampled("request_done", latency_ms=812)   # kept at LOG_SAMPLE_RATE
+"""
+import json
+import logging
+import os
+import random
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_root = logging.getLogger("agent")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+class StructLogger:
+    def __init__(self, name, sample_rate=LOG_SAMPLE_RATE):
+        self._logger = _root.getChild(name)
+        self.sample_rate = sample_rate
+
+    def _log(self, level, event, fields, exc_info=False):
+        # Level check first so disabled events cost one comparison
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, fields, exc_info)
+
+    def sampled(self, event, level=logging.INFO, **fields):
+        """Hot-path events: only a LOG_SAMPLE_RATE fraction is written"""
+        if self._logger.isEnabledFor(level) and random.random() < self.sample_rate:
+            fields["sample_rate"] = self.sample_rate
+            self._log(level, event, fields)
+
+
+def get_logger(name):
+    return StructLogger(name)
+
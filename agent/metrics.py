@@ -0,0 +1,182 @@
+"""Minimal Prometheus text-format metrics.
+
+Each gunicorn worker keeps its own registry, so a scrape reflects the worker
+that answered it; run one process per scrape target (threads or the ASGI mode)
+when exact totals matter.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {cumulative}")
+                labels = _label_str(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class SnapshotGauge:
+    """Exposes a component's stats dict (cache, queue, ...) as one labelled gauge"""
+
+    def __init__(self, name, help, snapshot):
+        self.name = name
+        self.help = help
+        self.snapshot = snapshot
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for stat, value in sorted(self.snapshot().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{self.name}{{stat="{stat}"}} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "agent_stage_seconds", "Time spent in each stage of /analyze", ("stage",)))
+IMAGE_BYTES = REGISTRY.register(Histogram(
+    "agent_image_bytes", "Image size as uploaded and as sent to the model", ("kind",), BYTES_BUCKETS))
+MODEL_TOKENS = REGISTRY.register(Histogram(
+    "agent_model_tokens", "Tokens per model call from usage metadata", ("stage", "kind", "demo", "context_cache"),
+    TOKEN_BUCKETS))
+MODEL_COST = REGISTRY.register(Counter(
+    "agent_model_cost_usd_total", "Estimated model spend from usage metadata at MODEL_PRICE_* rates",
+    ("stage", "demo")))
+REQUEST_TOKENS = REGISTRY.register(Histogram(
+    "agent_request_tokens", "Tokens per analysis across its model calls, by how it was answered",
+    ("kind", "cache", "demo"), (0,) + TOKEN_BUCKETS))
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    "agent_model_seconds", "Model call latency, by whether the instructions came from cached context",
+    ("stage", "context_cache")))
+MODEL_ATTEMPTS = REGISTRY.register(Counter(
+    "agent_model_attempts_total", "Individual model requests, including retries and hedges", ("stage", "outcome")))
+MODEL_HEDGES = REGISTRY.register(Counter(
+    "agent_model_hedges_total", "Duplicate requests sent because an attempt outlived the stage p95", ("stage",)))
+PARSE_FAILURES = REGISTRY.register(Counter(
+    "agent_parse_failures_total", "Model replies that could not be used", ("stage", "kind")))
+PRESCREEN_REJECTS = REGISTRY.register(Counter(
+    "agent_prescreen_rejects_total", "Uploads turned away by the CPU pre-screen, by reason", ("reason",)))
+STAGE2_SKIPS = REGISTRY.register(Counter(
+    "agent_stage2_skipped_total", "Description-stage model calls skipped because they could not change the verdict",
+    ("reason",)))
+STAGE2_SECONDS_SAVED = REGISTRY.register(Counter(
+    "agent_stage2_seconds_saved_total", "Model latency saved by skipped description calls, at the recent median"))
+BATCH_ITEMS = REGISTRY.register(Counter(
+    "agent_batch_items_total", "Items answered on /analyze/batch, by outcome", ("outcome",)))
+ANALYSES = REGISTRY.register(Counter(
+    "agent_analyses_total", "Analyses run by the pipeline, by outcome", ("outcome",)))
+
+
+@contextmanager
+def span(stage):
+    """Time a block into agent_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def usage_counts(response):
+    """A reply's usage metadata as {kind: count}, leaving out missing and zero counts"""
+    usage = getattr(response, "usage_metadata", None)
+    counts = {}
+    if usage is None:
+        return counts
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"),
+                        ("cached", "cached_content_token_count"), ("total", "total_token_count")):
+        value = getattr(usage, field, None)
+        if value:
+            counts[kind] = value
+    return counts
+
+
+def observe_usage(stage, response, **labels):
+    """Record a reply's token counts; returns them as {kind: count} for logging"""
+    counts = usage_counts(response)
+    for kind, value in counts.items():
+        MODEL_TOKENS.observe(value, stage=stage, kind=kind, **labels)
+    return counts
+
+
+def render():
+    return REGISTRY.render()
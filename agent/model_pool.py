@@ -0,0 +1,99 @@
+"""One GenerativeModel per distinct system instruction.
+
+When context caching is enabled the instruction is uploaded once as Gemini
+cached content and the model is bound to it, so each call is billed only for the
+image and the per-request text (plus the discounted cached tokens). Instructions
+below the API's minimum cacheable size, or any caching error, fall back to a
+plain model with the same system instruction.
+"""
+import datetime
+import os
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("model_pool")
+
+MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.5-flash")
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "true").lower() == "true"
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+# Recreate cached content this long before the server expires it
+CONTEXT_CACHE_MARGIN = 120.0
+
+
+def genai():
+    """The Gemini SDK, imported on first use; it is most of the agent's import time"""
+    import google.generativeai
+
+    return google.generativeai
+
+
+class _Entry:
+    def __init__(self, model, cached, expires_at):
+        self.model = model
+        self.cached = cached
+        self.expires_at = expires_at
+
+
+class ModelPool:
+    def __init__(self, model_name=MODEL_NAME, context_cache=CONTEXT_CACHE, ttl=CONTEXT_CACHE_TTL):
+        self.model_name = model_name
+        self.context_cache = context_cache
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._default = None
+        self.stats = {"context_caches_created": 0, "context_cache_failures": 0}
+
+    def peek(self, key):
+        """(model, uses_cached_context) if a live entry exists, else None; never blocks on the network"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry.expires_at:
+            return entry.model, entry.cached
+        return None
+
+    def get(self, key, system_instruction):
+        """(model, uses_cached_context) for this instruction, creating it if needed"""
+        if system_instruction is None:
+            if self._default is None:
+                self._default = genai().GenerativeModel(self.model_name)
+            return self._default, False
+        found = self.peek(key)
+        if found is not None:
+            return found
+        with self._lock:
+            found = self.peek(key)
+            if found is None:
+                entry = self._create(system_instruction)
+                self._entries[key] = entry
+                found = entry.model, entry.cached
+        return found
+
+    def _create(self, system_instruction):
+        if self.context_cache:
+            try:
+                cached = genai().caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    system_instruction=system_instruction,
+                    ttl=datetime.timedelta(seconds=self.ttl),
+                )
+                self.stats["context_caches_created"] += 1
+                log.info("context_cache_created", name=cached.name, tokens=cached.usage_metadata.total_token_count)
+                return _Entry(
+                    genai().GenerativeModel.from_cached_content(cached_content=cached),
+                    True,
+                    time.monotonic() + self.ttl - CONTEXT_CACHE_MARGIN,
+                )
+            except Exception as e:
+                # Most often the instruction is under the minimum cacheable token count
+                self.stats["context_cache_failures"] += 1
+                log.warning("context_cache_unavailable", error=str(e))
+        model = genai().GenerativeModel(self.model_name, system_instruction=system_instruction)
+        # Plain models never expire; re-check caching occasionally in case it was a transient error
+        return _Entry(model, False, time.monotonic() + self.ttl)
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["models"] = len(self._entries)
+        return stats
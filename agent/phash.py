@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from itertools import combinations
+
+from PIL import Image
+
+from cache import SqliteFile
+from logs import get_logger
+
+log = get_logger("phash")
+
+HASH_BITS = 64
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash; stable across re-encoding, resizing and light crops"""
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _to_signed(value):
+    # sqlite INTEGER is signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class MultiIndexHash:
+    """Multi-index hashing over Hamming space.
+
+    The hash is split into `chunks` substrings, each with its own table. Two hashes
+    within distance r must agree within floor(r / chunks) bits on at least one
+    substring, so a query only probes that small neighbourhood in every table.
+    """
+
+    def __init__(self, bits=HASH_BITS, chunks=4):
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.tables = [{} for _ in range(chunks)]
+        self.hashes = []
+        self._flips = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _neighbourhood(self, radius):
+        # Every chunk-sized mask with at most `radius` bits set
+        masks = self._flips.get(radius)
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for bits in combinations(range(self.chunk_bits), r):
+                    mask = 0
+                    for bit in bits:
+                        mask |= 1 << bit
+                    masks.append(mask)
+            self._flips[radius] = masks
+        return masks
+
+    def add(self, value):
+        item_id = len(self.hashes)
+        self.hashes.append(value)
+        for i, table in enumerate(self.tables):
+            chunk = (value >> (i * self.chunk_bits)) & self.chunk_mask
+            table.setdefault(chunk, []).append(item_id)
+        return item_id
+
+    def search(self, value, radius):
+        """Ids of stored hashes within `radius`, closest first"""
+        masks = self._neighbourhood(radius // self.chunks)
+        seen = set()
+        matches = []
+        hashes = self.hashes
+        for i, table in enumerate(self.tables):
+            chunk = (value >> (i * self.chunk_bits)) & self.chunk_mask
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if not bucket:
+                    continue
+                for item_id in bucket:
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                    distance = (hashes[item_id] ^ value).bit_count()
+                    if distance <= radius:
+                        matches.append((distance, item_id))
+        matches.sort()
+        return matches
+
+
+class NearDuplicateIndex:
+    """Perceptual-hash index mapping near-identical photos to a stored stage-1 verdict.
+
+    Entries are scoped (e.g. by reported type/severity and the types list) because
+    those inputs change the stage-1 answer even for the same picture. When `path`
+    is set the index is persisted to SQLite and other workers' inserts are pulled
+    in periodically.
+
+    Like the result cache, entries expire after `ttl` seconds and only the newest
+    `max_entries` are kept, in memory and in the SQLite table. The in-memory index
+    is append-only, so it is rebuilt from the live entries every ttl/10 seconds,
+    or sooner once it grows a quarter past max_entries.
+    """
+
+    def __init__(self, max_distance=5, path=None, sync_interval=5.0, ttl=3600.0, max_entries=100_000):
+        self.max_distance = max_distance
+        self.path = path
+        self.sync_interval = sync_interval
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._index = MultiIndexHash()
+        self._scopes = []
+        self._payloads = []
+        self._created = []
+        self._lock = threading.RLock()
+        self._last_rowid = 0
+        self._last_sync = 0.0
+        self._last_compact = time.time()
+        self.db = None
+        self.stats = {"near_duplicate_hits": 0, "near_duplicate_misses": 0, "near_duplicate_evicted": 0}
+
+        if path:
+            self.db = SqliteFile(path, (
+                "CREATE TABLE IF NOT EXISTS phash_index ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, hash INTEGER NOT NULL, "
+                "scope TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)",
+            ))
+            self._trim(self.db.conn(), time.time())
+            self.sync(force=True)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _insert_local(self, value, scope, payload, created_at):
+        self._index.add(value)
+        self._scopes.append(scope)
+        self._payloads.append(payload)
+        self._created.append(created_at)
+
+    def _compact(self, now):
+        """Rebuild the in-memory index from the unexpired, newest max_entries entries"""
+        over = len(self._created) > self.max_entries
+        expired = bool(self._created) and self._created[0] < now - self.ttl
+        if not (over or expired):
+            return
+        if now - self._last_compact < self.ttl / 10 and len(self._created) <= self.max_entries * 1.25:
+            return
+        self._last_compact = now
+        cutoff = now - self.ttl
+        live = [i for i, created_at in enumerate(self._created) if created_at >= cutoff][-self.max_entries:]
+        entries = [(self._index.hashes[i], self._scopes[i], self._payloads[i], self._created[i]) for i in live]
+        self.stats["near_duplicate_evicted"] += len(self._created) - len(entries)
+        self._index = MultiIndexHash()
+        self._scopes, self._payloads, self._created = [], [], []
+        for entry in entries:
+            self._insert_local(*entry)
+
+    def _trim(self, conn, now):
+        """Delete expired rows and all but the newest max_entries"""
+        try:
+            conn.execute("DELETE FROM phash_index WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM phash_index WHERE id <= ("
+                "SELECT id FROM phash_index ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            log.error("near_duplicate_trim_failed", error=str(e))
+
+    def sync(self, force=False):
+        """Load rows written since the last sync (by this or any other worker)"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            self._last_sync = now
+            try:
+                rows = self.db.conn().execute(
+                    "SELECT id, hash, scope, payload, created_at FROM phash_index "
+                    "WHERE id > ? AND created_at >= ? ORDER BY id",
+                    (self._last_rowid, time.time() - self.ttl),
+                ).fetchall()
+            except sqlite3.Error as e:
+                log.error("near_duplicate_sync_failed", error=str(e))
+                return
+            for rowid, value, scope, payload, created_at in rows:
+                self._insert_local(_to_unsigned(value), scope, json.loads(payload), created_at)
+                self._last_rowid = rowid
+
+    def lookup(self, value, scope):
+        """Closest stored payload within max_distance for this scope, or None"""
+        self.sync()
+        now = time.time()
+        with self._lock:
+            self._compact(now)
+            cutoff = now - self.ttl
+            for distance, item_id in self._index.search(value, self.max_distance):
+                if self._scopes[item_id] == scope and self._created[item_id] >= cutoff:
+                    self.stats["near_duplicate_hits"] += 1
+                    return self._payloads[item_id], distance
+            self.stats["near_duplicate_misses"] += 1
+        return None, None
+
+    def add(self, value, scope, payload):
+        now = time.time()
+        with self._lock:
+            if not self.path:
+                self._insert_local(value, scope, payload, now)
+                return
+            try:
+                conn = self.db.conn()
+                conn.execute(
+                    "INSERT INTO phash_index (hash, scope, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (_to_signed(value), scope, json.dumps(payload), now),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error("near_duplicate_write_failed", error=str(e))
+                self._insert_local(value, scope, payload, now)
+                return
+            if self.db.wrote():
+                self._trim(conn, now)
+            # Pull our own row (and anything other workers added) back in id order
+            self.sync(force=True)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["near_duplicate_entries"] = len(self._index)
+        return stats
+
+
+def near_duplicate_index_from_env():
+    return NearDuplicateIndex(
+        max_distance=int(os.getenv("PHASH_MAX_DISTANCE", "5")),
+        path=os.getenv("PHASH_INDEX_PATH", os.path.join(os.path.dirname(__file__), ".cache", "phash.sqlite3")) or None,
+        sync_interval=float(os.getenv("PHASH_SYNC_INTERVAL", "5")),
+        ttl=float(os.getenv("PHASH_TTL", os.getenv("RESULT_CACHE_TTL", "3600"))),
+        max_entries=int(os.getenv("PHASH_MAX_ENTRIES", "100000")),
+    )
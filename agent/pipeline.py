@@ -0,0 +1,637 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+
+from backends import backend_from_env
+from budget import ResolutionPolicy, model_cost
+from cache import cache_from_env, make_cache_key, normalize_field
+from logs import get_logger
+from metrics import (
+    ANALYSES, IMAGE_BYTES, MODEL_COST, MODEL_SECONDS, PARSE_FAILURES, PRESCREEN_REJECTS, REGISTRY, REQUEST_TOKENS,
+    STAGE2_SECONDS_SAVED, STAGE2_SKIPS, STAGE_SECONDS, SnapshotGauge,
+    observe_usage, span,
+)
+from phash import near_duplicate_index_from_env
+from preprocess import ImageDecodeError, submit_prepare
+from prompts import DEMO_MODE, compile_prompts, user_description, user_details
+from resilience import ModelUnavailable, ResilientCaller
+from similarity import LOCAL_SIMILARITY, description_score
+from singleflight import SingleFlight
+from types_registry import types_registry_from_env
+from uploads import as_upload
+
+load_dotenv()
+log = get_logger("pipeline")
+
+# Gemini, or the local fake with MODEL_BACKEND=fake
+backend = backend_from_env()
+# Deadlines, retries, hedging and the circuit breaker around every backend call
+caller = ResilientCaller()
+# The image token budget per analysis, within the token, latency and load limits (see budget.py)
+resolution = ResolutionPolicy()
+
+# "two_stage" (image call, then description call) or "fused" (one schema-constrained call)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "two_stage")
+# Blended probability at or above which a report is an incident
+INCIDENT_THRESHOLD = 0.6
+# Skip the description call when its score can't change the verdict (see stage2_skip_reason)
+STAGE2_SKIP = os.getenv("STAGE2_SKIP", "true").lower() == "true"
+# Token and cost metrics label, matching the prompts' cache key
+DEMO_LABEL = "demo" if DEMO_MODE else "live"
+
+result_cache = cache_from_env()
+near_duplicates = near_duplicate_index_from_env()
+# Where drive_async runs StoreCalls: SQLite can wait up to its 5 s busy timeout on another worker's lock
+store_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STORE_WORKERS", "4")), thread_name_prefix="store")
+inflight = SingleFlight()
+types_registry = types_registry_from_env()
+
+REGISTRY.register(SnapshotGauge("agent_result_cache", "Result cache counters", result_cache.snapshot))
+REGISTRY.register(SnapshotGauge("agent_near_duplicates", "Near-duplicate index counters", near_duplicates.snapshot))
+REGISTRY.register(SnapshotGauge("agent_inflight", "Request coalescing counters", inflight.snapshot))
+REGISTRY.register(SnapshotGauge("agent_types_registry", "Types registry counters", types_registry.snapshot_stats))
+REGISTRY.register(SnapshotGauge("agent_model_backend", "Model backend counters", backend.snapshot))
+REGISTRY.register(SnapshotGauge("agent_circuit_breaker", "Model circuit breaker state and counters", caller.snapshot))
+REGISTRY.register(SnapshotGauge("agent_image_budget", "Adaptive image token budget and what tightened it",
+                                resolution.snapshot))
+
+class ImageOutput(BaseModel):
+    disaster_probability: float
+    disaster_type: str
+    disaster_severity: str
+    reasoning: str
+
+class DescOutput(BaseModel):
+    description_similarity_score: float
+    reformulated_description: str
+
+class FusedOutput(BaseModel):
+    disaster_probability: float
+    disaster_type: str
+    disaster_severity: str
+    reasoning: str
+    description_similarity_score: float
+    reformulated_description: str
+
+class AnalysisError(Exception):
+    """Model output we can't use; carries the JSON error body for the client"""
+
+    def __init__(self, payload, status=500, retry_after=None):
+        super().__init__(payload.get("error"))
+        self.payload = payload
+        self.status = status
+        self.retry_after = retry_after
+
+class FinalOutput(BaseModel):
+    is_incident: bool
+    probability: float
+    reformulated_description: str
+    type: str
+    severity: str
+    reasoning: str
+
+class Verdict(BaseModel):
+    """The stage-1 answer, sent ahead of the description stage on streaming /analyze.
+
+    probability is the image model's; the final blend can only land within
+    [min_probability, max_probability], and settled means is_incident can't change.
+    """
+    is_incident: bool
+    probability: float
+    min_probability: float
+    max_probability: float
+    settled: bool
+    type: str
+    severity: str
+    reasoning: str
+
+@dataclass
+class ModelCall:
+    """A generate_content request yielded by analysis_steps for a driver to execute"""
+    stage: str
+    contents: list
+    generation_config: object = None
+    # Static instructions, sent as the system instruction (and context-cached) under prompt_key
+    system_instruction: str = None
+    prompt_key: str = None
+
+
+@dataclass
+class StoreCall:
+    """A result-cache or near-duplicate index operation yielded by analysis_steps; fn(*args) may block on SQLite"""
+    fn: object
+    args: tuple = ()
+
+
+def strip_json_fences(text):
+    raw_text = text.strip()
+    if raw_text.startswith("```json"):
+        raw_text = raw_text.removeprefix("```json").removesuffix("```").strip()
+    return raw_text
+
+
+def parse_model_json(text, stage):
+    raw_text = strip_json_fences(text)
+    try:
+        return json.loads(raw_text)
+    except json.JSONDecodeError:
+        PARSE_FAILURES.inc(stage=stage, kind="json")
+        log.warning("model_reply_not_json", stage=stage, raw=raw_text[:500])
+        raise AnalysisError({"error": "Failed to parse model response as JSON", "raw": raw_text})
+
+
+def image_call(prepared, input_type, input_severity, prompts):
+    """Stage 1: classify the photo itself"""
+    return ModelCall(
+        stage="image",
+        contents=[
+            {"mime_type": prepared.mime_type, "data": prepared.data},
+            user_details(input_type, input_severity),
+        ],
+        system_instruction=prompts.image,
+        prompt_key=prompts.key("image"),
+    )
+
+
+def parse_image_output(text):
+    json_data = parse_model_json(text, "image")
+    try:
+        return ImageOutput(
+            disaster_type=json_data.get("disaster_type", "unknown"),
+            disaster_probability=json_data.get("disaster_probability", 0.0),
+            disaster_severity=json_data.get("disaster_severity","unknown"),
+            reasoning=json_data.get("reasoning", "unknown"),
+        )
+    except ValidationError as e:
+        PARSE_FAILURES.inc(stage="image", kind="validation")
+        raise AnalysisError({"error": "Output format invalid", "details": e.errors()})
+
+
+def desc_call(input_desc, reasoning, prompts):
+    """Stage 2: score the user's description and rewrite it as a news-style summary"""
+    has_description = input_desc.strip() != ""
+    contents = [user_description(input_desc)] if has_description else []
+    contents.append(f"Reasoning generated from analyzing the image: {reasoning} ")
+    return ModelCall(
+        stage="description",
+        contents=contents,
+        system_instruction=prompts.description(has_description),
+        prompt_key=prompts.key("description", has_description),
+    )
+
+
+def parse_desc_output(text):
+    json_data = parse_model_json(text, "description")
+    try:
+        return DescOutput(
+            description_similarity_score=json_data.get("description_similarity_score", 0.0),
+            reformulated_description=json_data.get("reformulated_description", "no description")
+        )
+    except ValidationError as e:
+        PARSE_FAILURES.inc(stage="description", kind="validation")
+        raise AnalysisError({"error": "Output format invalid", "details": e.errors()})
+
+
+def fused_call(prepared, input_desc, input_type, input_severity, prompts):
+    """Both stages in one call; the response schema replaces the prompts' JSON examples"""
+    has_description = input_desc.strip() != ""
+    contents = [
+        {"mime_type": prepared.mime_type, "data": prepared.data},
+        user_details(input_type, input_severity),
+    ]
+    if has_description:
+        contents.append(user_description(input_desc))
+    return ModelCall(
+        stage="fused",
+        contents=contents,
+        generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": FusedOutput,
+        },
+        system_instruction=prompts.fused(has_description),
+        prompt_key=prompts.key("fused", has_description),
+    )
+
+
+def warm_up_calls(mode=None):
+    """Empty ModelCalls carrying each system instruction the current mode sends, for backend.warm_up"""
+    types_snapshot = types_registry.snapshot()
+    prompts = compile_prompts(types_snapshot.names, types_snapshot.version)
+    if (mode or ANALYSIS_MODE) == "fused":
+        stages = [("fused", prompts.fused(True), prompts.key("fused", True)),
+                  ("fused", prompts.fused(False), prompts.key("fused", False))]
+    else:
+        stages = [("image", prompts.image, prompts.key("image")),
+                  ("description", prompts.description(True), prompts.key("description", True)),
+                  ("description", prompts.description(False), prompts.key("description", False))]
+    return [ModelCall(stage=stage, contents=[], system_instruction=instruction, prompt_key=key)
+            for stage, instruction, key in stages]
+
+
+def parse_fused_output(text):
+    try:
+        fused = FusedOutput.model_validate_json(text)
+    except ValidationError as e:
+        PARSE_FAILURES.inc(stage="fused", kind="validation")
+        raise AnalysisError({"error": "Output format invalid", "details": e.errors()})
+    image_result = ImageOutput(
+        disaster_probability=fused.disaster_probability,
+        disaster_type=fused.disaster_type,
+        disaster_severity=fused.disaster_severity,
+        reasoning=fused.reasoning,
+    )
+    desc_result = DescOutput(
+        description_similarity_score=fused.description_similarity_score,
+        reformulated_description=fused.reformulated_description,
+    )
+    return image_result, desc_result
+
+
+def combine(image_result, desc_result, desc_empty):
+    if image_result.disaster_probability == 0.0:
+        proba = 0.0
+    elif desc_empty == True:
+        proba = image_result.disaster_probability
+    else:
+        proba = image_result.disaster_probability*0.8 + desc_result.description_similarity_score*0.2
+
+    if proba < INCIDENT_THRESHOLD:
+        is_incident = False
+    else:
+        is_incident = True
+    desc = desc_result.reformulated_description
+
+    try:
+        return FinalOutput(
+            is_incident= is_incident,
+            probability= proba,
+            reformulated_description= desc,
+            type = image_result.disaster_type,
+            severity= image_result.disaster_severity,
+            reasoning= image_result.reasoning
+        )
+    except ValidationError as e:
+        raise AnalysisError({"error": "Output format invalid", "details": e.errors()})
+
+
+def probability_bounds(image_result, desc_empty, desc_score=None):
+    """Lowest and highest probability combine() can produce; desc_score pins it if already known"""
+    proba = image_result.disaster_probability
+    if proba == 0.0 or desc_empty:
+        return proba, proba
+    if desc_score is not None:
+        return proba*0.8 + desc_score*0.2, proba*0.8 + desc_score*0.2
+    return proba*0.8, proba*0.8 + 0.2
+
+
+def stage2_skip_reason(image_result, desc_empty, desc_score=None):
+    """Why the description call can be skipped, or None when its answer could still matter.
+
+    Its score only moves the probability, and its rewrite is only used for
+    accepted incidents, so it adds nothing once the report can't reach INCIDENT_THRESHOLD.
+    Reports that are certain to pass still need the rewrite; streaming clients
+    get their verdict before it (see Verdict).
+    """
+    if not STAGE2_SKIP:
+        return None
+    if image_result.disaster_probability == 0.0:
+        return "zero_probability"
+    if probability_bounds(image_result, desc_empty, desc_score)[1] < INCIDENT_THRESHOLD:
+        return "below_threshold" if desc_score is None else "local_similarity"
+    return None
+
+
+def skipped_description(input_desc, desc_score):
+    """Stands in for the description stage's output; an unscored description counts as no support"""
+    return DescOutput(
+        description_similarity_score=desc_score if desc_score is not None else 0.0,
+        reformulated_description=input_desc.strip(),
+    )
+
+
+def record_stage2_skip(reason):
+    STAGE2_SKIPS.inc(reason=reason)
+    # What the call would have cost, going by recent description calls
+    saved = caller.latency.quantile("description", 0.5, min_samples=1)
+    if saved is not None:
+        STAGE2_SECONDS_SAVED.inc(saved)
+
+
+def provisional_verdict(image_result, desc_empty, desc_score=None):
+    low, high = probability_bounds(image_result, desc_empty, desc_score)
+    settled = (low >= INCIDENT_THRESHOLD) == (high >= INCIDENT_THRESHOLD)
+    # A settled verdict is whatever the bounds agree on; otherwise it leans on the image alone
+    is_incident = low >= INCIDENT_THRESHOLD if settled else image_result.disaster_probability >= INCIDENT_THRESHOLD
+    return Verdict(
+        is_incident=is_incident,
+        probability=image_result.disaster_probability,
+        min_probability=low,
+        max_probability=high,
+        settled=settled,
+        type=image_result.disaster_type,
+        severity=image_result.disaster_severity,
+        reasoning=image_result.reasoning,
+    )
+
+
+def final_verdict(final_result):
+    """A settled Verdict for answers that arrive whole (cache hits, fused mode, coalesced requests)"""
+    proba = final_result["probability"]
+    return Verdict(
+        is_incident=final_result["is_incident"],
+        probability=proba,
+        min_probability=proba,
+        max_probability=proba,
+        settled=True,
+        type=final_result["type"],
+        severity=final_result["severity"],
+        reasoning=final_result["reasoning"],
+    )
+
+
+def prescreen_output(screen):
+    """The verdict for an upload the pre-screen rejected; no model call was made"""
+    return FinalOutput(
+        is_incident=False,
+        probability=0.0,
+        reformulated_description="",
+        type="unknown",
+        severity="unknown",
+        reasoning=f"Rejected before analysis: {screen.detail}.",
+    )
+
+
+def request_key(upload, input_desc, input_type, input_severity, types_snapshot, mode=None):
+    """Identical photo + form fields + prompts (types list, demo mode, text) + mode means an identical verdict.
+
+    STAGE2_SKIP and LOCAL_SIMILARITY change how the final probability is reached,
+    so they are part of the key too; the disk cache outlives a flag flip.
+    """
+    prompts = compile_prompts(types_snapshot.names, types_snapshot.version)
+    policy = f"skip={int(STAGE2_SKIP)}:local={int(LOCAL_SIMILARITY)}"
+    return make_cache_key(upload.digest, input_desc, input_type, input_severity,
+                          f"{prompts.scope}:{mode or ANALYSIS_MODE}:{policy}")
+
+
+def record_request_usage(usage, cache):
+    """One analysis's token totals; answers that made no model call count as zero"""
+    for kind in ("prompt", "output", "cached", "total"):
+        REQUEST_TOKENS.observe(usage.tokens.get(kind, 0), kind=kind, cache=cache, demo=DEMO_LABEL)
+
+
+def analysis_steps(upload, input_desc, input_type, input_severity, cache_key, types_snapshot, mode=None):
+    """The /analyze flow, independent of the web framework and of how I/O is awaited.
+
+    Yields preprocessing futures, StoreCalls and ModelCalls; the driver sends back
+    the future's result, the store operation's return value or the model response. In two-stage mode it also yields the stage-1
+    Verdict before the description call, for streaming clients. Returns the
+    FinalOutput dict.
+    """
+    usage = resolution.acquire()
+    try:
+        return (yield from _analysis_steps(
+            upload, input_desc, input_type, input_severity, cache_key, types_snapshot, mode or ANALYSIS_MODE, usage))
+    finally:
+        resolution.release(usage)
+
+
+def _analysis_steps(upload, input_desc, input_type, input_severity, cache_key, types_snapshot, mode, usage):
+    # Decode/resize on the preprocessing pool while we check the cache, to the size the policy allows
+    prepare_future = submit_prepare(upload, max_tokens=usage.image_budget)
+    IMAGE_BYTES.observe(upload.size, kind="original")
+
+    with span("cache_lookup"):
+        cached = yield StoreCall(result_cache.get, (cache_key,))
+    if cached is not None:
+        prepare_future.cancel()
+        ANALYSES.inc(outcome="cache_hit")
+        record_request_usage(usage, "hit")
+        log.sampled("analysis_done", cache="hit", is_incident=cached["is_incident"])
+        return cached
+
+    try:
+        prepared = yield prepare_future
+    except ImageDecodeError as e:
+        raise AnalysisError({"error": "Uploaded file is not a readable image", "details": str(e)}, status=400)
+    STAGE_SECONDS.observe(prepared.elapsed_ms / 1000, stage="preprocess")
+    screen = prepared.screen
+    if screen is not None:
+        STAGE_SECONDS.observe(screen.elapsed_ms / 1000, stage="prescreen")
+        if screen.reject:
+            PRESCREEN_REJECTS.inc(reason=screen.reason)
+            ANALYSES.inc(outcome="prescreen_reject")
+            record_request_usage(usage, "prescreen")
+            log.sampled("analysis_done", cache="prescreen", reason=screen.reason, **screen.measures)
+            return prescreen_output(screen).model_dump()
+    IMAGE_BYTES.observe(len(prepared.data), kind="prepared")
+    log.debug(
+        "image_prepared",
+        source_format=prepared.source_format,
+        mime_type=prepared.mime_type,
+        size=f"{prepared.width}x{prepared.height}",
+        image_tokens=prepared.image_tokens,
+        image_budget=usage.image_budget,
+        original_bytes=prepared.original_size,
+        bytes_saved=prepared.bytes_saved,
+        elapsed_ms=round(prepared.elapsed_ms, 1),
+    )
+
+    # Re-encoded or lightly cropped copies of a known photo reuse its stage-1 verdict
+    with span("prompt_build"):
+        prompts = compile_prompts(types_snapshot.names, types_snapshot.version)
+
+    near_dup_scope = "|".join([normalize_field(input_type), normalize_field(input_severity), prompts.scope])
+    image_result = None
+    desc_result = None
+    cache_status = "miss"
+    with span("near_duplicate_lookup"):
+        stored, distance = yield StoreCall(near_duplicates.lookup, (prepared.phash, near_dup_scope))
+    if stored is not None:
+        cache_status = "near_duplicate"
+        log.debug("near_duplicate_hit", distance=distance)
+        image_result = ImageOutput(**stored)
+
+    if image_result is None:
+        usage.image_tokens = prepared.image_tokens
+    if image_result is None and mode == "fused":
+        start = time.perf_counter()
+        response = yield fused_call(prepared, input_desc, input_type, input_severity, prompts)
+        usage.add(response, time.perf_counter() - start)
+        log.debug("model_reply", stage="fused", text=response.text)
+        with span("parse_fused"):
+            image_result, desc_result = parse_fused_output(response.text)
+        yield StoreCall(near_duplicates.add, (prepared.phash, near_dup_scope, image_result.model_dump()))
+    elif image_result is None:
+        start = time.perf_counter()
+        response = yield image_call(prepared, input_type, input_severity, prompts)
+        usage.add(response, time.perf_counter() - start)
+        log.debug("model_reply", stage="image", text=response.text)
+        with span("parse_image"):
+            image_result = parse_image_output(response.text)
+        yield StoreCall(near_duplicates.add, (prepared.phash, near_dup_scope, image_result.model_dump()))
+
+    desc_empty = input_desc.strip() == ""
+    stage2_skipped = None
+    if desc_result is None:
+        local_score = None
+        if LOCAL_SIMILARITY and not desc_empty and image_result.disaster_probability > 0.0:
+            with span("local_similarity"):
+                local_score = description_score(input_desc, image_result.reasoning, image_result.disaster_type)
+        stage2_skipped = stage2_skip_reason(image_result, desc_empty, local_score)
+        if stage2_skipped is not None:
+            record_stage2_skip(stage2_skipped)
+            desc_result = skipped_description(input_desc, local_score)
+        else:
+            yield provisional_verdict(image_result, desc_empty, local_score)
+            start = time.perf_counter()
+            desc_response = yield desc_call(input_desc, image_result.reasoning, prompts)
+            usage.add(desc_response, time.perf_counter() - start)
+            log.debug("model_reply", stage="description", text=desc_response.text)
+            with span("parse_description"):
+                desc_result = parse_desc_output(desc_response.text)
+            if local_score is not None:
+                # The verdict was decided on the local score; the call was only for the rewrite
+                desc_result = desc_result.model_copy(update={"description_similarity_score": local_score})
+
+    final_result = combine(image_result, desc_result, desc_empty).model_dump()
+    yield StoreCall(result_cache.set, (cache_key, final_result))
+    ANALYSES.inc(outcome=cache_status)
+    record_request_usage(usage, cache_status)
+    log.sampled(
+        "analysis_done",
+        cache=cache_status,
+        mode=mode,
+        stage2_skipped=stage2_skipped,
+        is_incident=final_result["is_incident"],
+        probability=round(final_result["probability"], 3),
+        type=final_result["type"],
+        severity=final_result["severity"],
+        **usage.log_fields(),
+    )
+    return final_result
+
+
+def degraded(e):
+    """The client-facing answer when the model is unreachable: a clear 503, never a guessed verdict"""
+    return AnalysisError(
+        {"error": "Analysis temporarily unavailable", "degraded": True, "reason": e.reason, "stage": e.stage,
+         "retry_after": e.retry_after},
+        status=503,
+        retry_after=e.retry_after,
+    )
+
+
+def outcome_label(e):
+    if e.status == 503:
+        return "unavailable"
+    return "bad_request" if e.status < 500 else "invalid_output"
+
+
+def record_model_call(step, reply, elapsed, context_cached):
+    """Latency, tokens and cost per call, split by context caching so its savings show up directly"""
+    context_cache = "hit" if context_cached else "off"
+    MODEL_SECONDS.observe(elapsed, stage=step.stage, context_cache=context_cache)
+    usage = observe_usage(step.stage, reply, demo=DEMO_LABEL, context_cache=context_cache)
+    MODEL_COST.inc(model_cost(usage), stage=step.stage, demo=DEMO_LABEL)
+    log.debug("model_call", stage=step.stage, context_cache=context_cache, elapsed_ms=round(elapsed * 1000, 1), **usage)
+
+
+def run_analysis(image, input_desc, input_type, input_severity, mode=None, on_verdict=None):
+    """Blocking analysis (Flask / threaded workers); concurrent duplicates share one run.
+
+    image is a spooled Upload, or the raw bytes. on_verdict(dict) is called with the stage-1 Verdict when the run produces one;
+    a request coalesced onto another's run only gets the final result.
+    """
+    upload = as_upload(image)
+    types_snapshot = types_registry.snapshot()
+    cache_key = request_key(upload, input_desc, input_type, input_severity, types_snapshot, mode)
+    steps = analysis_steps(upload, input_desc, input_type, input_severity, cache_key, types_snapshot, mode)
+    with span("total"):
+        return inflight.do(cache_key, drive, steps, on_verdict)
+
+
+async def run_analysis_async(image, input_desc, input_type, input_severity, mode=None, on_verdict=None):
+    """Analysis on the event loop with the async Gemini client; duplicates share one run"""
+    upload = as_upload(image)
+    types_snapshot = types_registry.snapshot()
+    cache_key = request_key(upload, input_desc, input_type, input_severity, types_snapshot, mode)
+    steps = analysis_steps(upload, input_desc, input_type, input_severity, cache_key, types_snapshot, mode)
+    with span("total"):
+        return await inflight.do_async(cache_key, drive_async, steps, on_verdict)
+
+
+def drive(steps, on_verdict=None):
+    """Run analysis_steps with blocking model calls"""
+    reply, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(reply)
+        except StopIteration as done:
+            return done.value
+        except AnalysisError as e:
+            ANALYSES.inc(outcome=outcome_label(e))
+            raise
+        except Exception:
+            ANALYSES.inc(outcome="failed")
+            raise
+        reply, error = None, None
+        if isinstance(step, Verdict):
+            if on_verdict is not None:
+                on_verdict(step.model_dump())
+            continue
+        try:
+            if isinstance(step, ModelCall):
+                start = time.perf_counter()
+                with span(f"model_{step.stage}"):
+                    reply, context_cached = caller.call(backend, step)
+                record_model_call(step, reply, time.perf_counter() - start, context_cached)
+            elif isinstance(step, StoreCall):
+                reply = step.fn(*step.args)
+            else:
+                reply = step.result()
+        except ModelUnavailable as e:
+            error = degraded(e)
+        except Exception as e:
+            error = e
+
+
+async def drive_async(steps, on_verdict=None):
+    """Run analysis_steps, awaiting model calls and preprocessing futures"""
+    reply, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(reply)
+        except StopIteration as done:
+            return done.value
+        except AnalysisError as e:
+            ANALYSES.inc(outcome=outcome_label(e))
+            raise
+        except Exception:
+            ANALYSES.inc(outcome="failed")
+            raise
+        reply, error = None, None
+        if isinstance(step, Verdict):
+            if on_verdict is not None:
+                on_verdict(step.model_dump())
+            continue
+        try:
+            if isinstance(step, ModelCall):
+                start = time.perf_counter()
+                with span(f"model_{step.stage}"):
+                    reply, context_cached = await caller.call_async(backend, step)
+                record_model_call(step, reply, time.perf_counter() - start, context_cached)
+            elif isinstance(step, StoreCall):
+                # Off the event loop, so a locked SQLite file stalls this analysis, not every one
+                reply = await asyncio.get_running_loop().run_in_executor(store_executor, step.fn, *step.args)
+            else:
+                reply = await asyncio.wrap_future(step)
+        except ModelUnavailable as e:
+            error = degraded(e)
+        except Exception as e:
+            error = e
@@ -0,0 +1,162 @@
+import io
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+import prescreen
+from phash import dhash
+from uploads import as_upload
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+IMAGE_TOKEN_BUDGET = int(os.getenv("IMAGE_TOKEN_BUDGET", "1032"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Small files in a format the model accepts are sent as-is when nothing needs changing
+IMAGE_PASSTHROUGH_BYTES = int(os.getenv("IMAGE_PASSTHROUGH_BYTES", "262144"))
+
+# Gemini bills an image as one 258-token tile when both sides are <= 384px,
+# otherwise as 258 tokens per 768x768 tile
+TOKENS_PER_TILE = 258
+TILE_SIDE = 768
+SMALL_IMAGE_SIDE = 384
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "HEIF": "image/heif",
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_name_prefix="preprocess",
+)
+
+
+class ImageDecodeError(Exception):
+    pass
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+    source_format: str
+    phash: int
+    elapsed_ms: float
+    # Pre-screen verdict; a rejected upload is not re-encoded and has empty data
+    screen: prescreen.ScreenResult = None
+
+    @property
+    def bytes_saved(self):
+        return self.original_size - len(self.data)
+
+    @property
+    def image_tokens(self):
+        return estimate_image_tokens(self.width, self.height)
+
+
+def estimate_image_tokens(width, height):
+    if width <= SMALL_IMAGE_SIDE and height <= SMALL_IMAGE_SIDE:
+        return TOKENS_PER_TILE
+    return TOKENS_PER_TILE * math.ceil(width / TILE_SIDE) * math.ceil(height / TILE_SIDE)
+
+
+def target_size(width, height, max_side=IMAGE_MAX_SIDE, max_tokens=IMAGE_TOKEN_BUDGET):
+    """Largest size (never upscaled) within max_side that stays under the token budget"""
+    scale = min(1.0, max_side / max(width, height))
+    if estimate_image_tokens(width * scale, height * scale) > max_tokens:
+        max_tiles = max_tokens // TOKENS_PER_TILE
+        if max_tiles <= 1:
+            # A single tile only fits the small-image bucket
+            best = SMALL_IMAGE_SIDE / max(width, height)
+        else:
+            best = 0.0
+            for tiles_w in range(1, max_tiles + 1):
+                tiles_h = max_tiles // tiles_w
+                best = max(best, min(tiles_w * TILE_SIDE / width, tiles_h * TILE_SIDE / height))
+        scale = min(scale, best)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def prepare_image(upload, max_side=IMAGE_MAX_SIDE, max_tokens=IMAGE_TOKEN_BUDGET, quality=IMAGE_JPEG_QUALITY):
+    """Decode, orient, downscale and re-encode an upload (an Upload or bytes) for the model.
+
+    The image is decoded straight from the upload's file; its bytes are only
+    read into memory when they are sent to the model unchanged.
+    """
+    start = time.perf_counter()
+    upload = as_upload(upload)
+    try:
+        image = Image.open(upload.open())
+        source_format = image.format or "UNKNOWN"
+        orientation = image.getexif().get(0x0112, 1)
+
+        width, height = image.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        new_size = target_size(width, height, max_side, max_tokens)
+        resize = new_size != (width, height)
+        # The perceptual hash and the pre-screen (whose thresholds are tuned at this
+        # size) see a copy at the default size, whatever budget this request was given
+        reference_size = target_size(width, height)
+        work_size = max(new_size, reference_size)
+
+        if work_size != (width, height) and source_format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full resolution; draft
+            # works in stored (pre-rotation) coordinates and keeps both sides >= the request
+            draft_size = work_size[::-1] if orientation in (5, 6, 7, 8) else work_size
+            image.draft("RGB", draft_size)
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+        if work_size != (width, height):
+            # reducing_gap does most of a large reduction with a cheap box filter first
+            image = image.resize(work_size, Image.LANCZOS, reducing_gap=3.0)
+        reference = image
+        if new_size != work_size:
+            image = image.resize(new_size, Image.LANCZOS)
+        elif reference_size != work_size:
+            reference = image.resize(reference_size, Image.LANCZOS)
+        img_hash = dhash(reference)
+        screen = prescreen.screen(reference, (width, height)) if prescreen.PRESCREEN else None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageDecodeError(str(e)) from e
+
+    mime_type = MIME_TYPES.get(source_format)
+    untouched = not resize and orientation == 1
+    if screen is not None and screen.reject:
+        data = b""
+    elif untouched and mime_type and upload.size <= IMAGE_PASSTHROUGH_BYTES:
+        data = upload.read()
+    else:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output_buffer = io.BytesIO()
+        image.save(output_buffer, format="JPEG", quality=quality, optimize=True)
+        data = output_buffer.getvalue()
+        mime_type = "image/jpeg"
+        if untouched and len(data) >= upload.size and source_format in MIME_TYPES:
+            data, mime_type = upload.read(), MIME_TYPES[source_format]
+
+    return PreparedImage(
+        data=data,
+        mime_type=mime_type,
+        width=image.width,
+        height=image.height,
+        original_size=upload.size,
+        source_format=source_format,
+        phash=img_hash,
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+        screen=screen,
+    )
+
+
+def submit_prepare(upload, **kwargs):
+    """Run prepare_image on the preprocessing pool; returns a Future"""
+    return executor.submit(prepare_image, upload, **kwargs)
@@ -0,0 +1,153 @@
+"""CPU pre-screen that turns away uploads the model would reject anyway.
+
+Runs inside prepare_image on a copy downscaled to the default IMAGE_TOKEN_BUDGET
+size, whatever budget the request was given, in a few milliseconds, before any
+tokens are spent:
+
+- too_small: the upload's shorter side is under PRESCREEN_MIN_SIDE
+- low_entropy: a blank, black or blown-out frame, or a graphic with almost no
+  detail. Entropy (grey-level, in bits) is measured per tile and the most
+  detailed tile counts, so a dark night shot with a fire in one corner passes
+- flat_colours: most pixels fall in a handful of colours, as in cartoons and
+  graphics, and no tile has photo-like detail either. Dark and foggy photos
+  also have few colours once JPEG has flattened them, so colour alone never rejects
+- screen_capture: a strong periodic peak in the spectrum of the centre crop,
+  the pixel grid or moire of a photographed display. JPEG block artefacts on
+  smooth scenes such as fog peak too, so this needs PRESCREEN_SCREEN_CHECK as
+  well, and never runs in demo mode, since the demo prompt accepts screen captures
+
+The whole pre-screen is off unless PRESCREEN=true. Tune the thresholds with
+benchmarks/eval_prescreen.py against a labelled image set before turning it on.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from PIL import Image
+
+from prompts import DEMO_MODE
+
+PRESCREEN = os.getenv("PRESCREEN", "false").lower() == "true"
+
+
+@dataclass(frozen=True)
+class ScreenConfig:
+    min_side: int = int(os.getenv("PRESCREEN_MIN_SIDE", "160"))
+    min_entropy: float = float(os.getenv("PRESCREEN_MIN_ENTROPY", "3.0"))
+    max_top_colour_share: float = float(os.getenv("PRESCREEN_MAX_TOP_COLOUR_SHARE", "0.7"))
+    # A tile this detailed makes a few-colour image a photo rather than a graphic
+    min_photo_entropy: float = float(os.getenv("PRESCREEN_MIN_PHOTO_ENTROPY", "4.0"))
+    max_spectral_peak: float = float(os.getenv("PRESCREEN_MAX_SPECTRAL_PEAK", "30"))
+    screen_check: bool = os.getenv("PRESCREEN_SCREEN_CHECK", "false").lower() == "true" and not DEMO_MODE
+
+
+@dataclass(frozen=True)
+class ScreenResult:
+    reject: bool
+    reason: str = None
+    detail: str = ""
+    measures: dict = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+
+
+SUMMARY_SIDE = 128
+TILES = 4
+FFT_SIDE = 256
+TOP_COLOURS = 8
+
+
+def grey_entropy(grey):
+    counts = np.bincount(grey.ravel(), minlength=256).astype(np.float64)
+    p = counts[counts > 0] / counts.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def max_tile_entropy(grey, tiles=TILES):
+    """Entropy of the most detailed tile in a tiles x tiles grid over the sample"""
+    side = grey.shape[0] // tiles
+    grid = grey[:side * tiles, :side * tiles].reshape(tiles, side, tiles, side).swapaxes(1, 2)
+    return max(grey_entropy(tile) for tile in grid.reshape(tiles * tiles, -1))
+
+
+def top_colour_share(rgb):
+    """Share of sampled pixels in the TOP_COLOURS most common exact colours.
+
+    Sensor noise keeps even grey smoke or fog spread over many exact values,
+    while drawings and graphics are mostly a few identical flat fills.
+    """
+    rgb = rgb.astype(np.uint32)
+    packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    _, counts = np.unique(packed, return_counts=True)
+    if len(counts) > TOP_COLOURS:
+        counts = np.partition(counts, -TOP_COLOURS)[-TOP_COLOURS:]
+    return float(counts.sum() / packed.size)
+
+
+_radius_cache = {}
+
+
+def _radius(side):
+    r = _radius_cache.get(side)
+    if r is None:
+        fy = np.fft.fftfreq(side)[:, None]
+        fx = np.fft.rfftfreq(side)[None, :]
+        r = np.sqrt(fx * fx + fy * fy)
+        _radius_cache[side] = r
+    return r
+
+
+def spectral_peak(image):
+    """Strongest isolated peak in the whitened mid/high-frequency spectrum of the centre crop.
+
+    Natural scenes fall off roughly as 1/f, so multiplying by f flattens them;
+    a display's pixel grid or moire leaves narrow spikes far above the median.
+    """
+    width, height = image.size
+    side = min(FFT_SIDE, width, height)
+    left, top = (width - side) // 2, (height - side) // 2
+    crop = np.asarray(image.crop((left, top, left + side, top + side)).convert("L"), dtype=np.float32)
+    crop -= crop.mean()
+    window = np.hanning(side).astype(np.float32)
+    spectrum = np.abs(np.fft.rfft2(crop * window[:, None] * window[None, :]))
+    r = _radius(side)
+    band = r > 0.08
+    whitened = spectrum[band] * r[band]
+    return float(whitened.max() / (np.median(whitened) + 1e-6))
+
+
+def screen(image, original_size, config=None):
+    """Check a decoded upload; original_size is (width, height) before any downscaling"""
+    config = config or ScreenConfig()
+    start = time.perf_counter()
+    measures = {}
+
+    def result(reason=None, detail=""):
+        return ScreenResult(reason is not None, reason, detail, measures, (time.perf_counter() - start) * 1000)
+
+    short_side = min(original_size)
+    measures["short_side"] = short_side
+    if short_side < config.min_side:
+        return result("too_small", f"the image is only {original_size[0]}x{original_size[1]} pixels")
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # Histograms only need a pixel sample; averaging filters would blend noise into flat colour
+    summary = image.resize((SUMMARY_SIDE, SUMMARY_SIDE), Image.NEAREST)
+    rgb = np.asarray(summary)
+    grey = np.asarray(summary.convert("L"))
+
+    measures["entropy"] = round(max_tile_entropy(grey), 3)
+    if measures["entropy"] < config.min_entropy:
+        return result("low_entropy", "the image is blank or has almost no detail")
+
+    measures["top_colour_share"] = round(top_colour_share(rgb), 3)
+    if measures["top_colour_share"] > config.max_top_colour_share and measures["entropy"] < config.min_photo_entropy:
+        return result("flat_colours", "the image looks like a drawing or graphic rather than a photo")
+
+    if config.screen_check:
+        measures["spectral_peak"] = round(spectral_peak(image), 1)
+        if measures["spectral_peak"] > config.max_spectral_peak:
+            return result("screen_capture", "the image appears to be a photo of a screen")
+
+    return result()
@@ -0,0 +1,370 @@
+"""Deadlines, retries, hedging and a circuit breaker around model calls.
+
+Each stage gets a total time budget (MODEL_TIMEOUT_<STAGE>) covering every
+attempt, so a hung or flapping API can hold a worker for at most that long.
+Within the budget, retryable failures (timeouts, 429/5xx) are retried with
+jittered exponential backoff. With MODEL_HEDGE on, an attempt still running
+after the stage's recent p95 gets a duplicate request, up to
+MODEL_HEDGE_BUDGET duplicates per call on average, and the first answer wins.
+A blocking caller hands both attempts to a thread pool and returns with the
+winner; the loser runs on to its own timeout in the pool. Stages that still
+fail feed a circuit breaker; while it is open, calls fail at once with
+ModelUnavailable instead of queueing behind a dead API.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cache
+
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from backends import FakeBackendError
+from logs import get_logger
+from metrics import MODEL_ATTEMPTS, MODEL_HEDGES
+
+log = get_logger("resilience")
+
+STAGE_TIMEOUTS = {
+    "image": float(os.getenv("MODEL_TIMEOUT_IMAGE", "30")),
+    "description": float(os.getenv("MODEL_TIMEOUT_DESCRIPTION", "20")),
+    "fused": float(os.getenv("MODEL_TIMEOUT_FUSED", "40")),
+}
+MODEL_RETRIES = int(os.getenv("MODEL_RETRIES", "2"))
+MODEL_RETRY_BASE = float(os.getenv("MODEL_RETRY_BASE", "0.5"))
+MODEL_RETRY_MAX = float(os.getenv("MODEL_RETRY_MAX", "4"))
+MODEL_HEDGE = os.getenv("MODEL_HEDGE", "false").lower() == "true"
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+# Duplicates allowed per model call on average, so a uniformly slow API isn't called twice as often
+MODEL_HEDGE_BUDGET = float(os.getenv("MODEL_HEDGE_BUDGET", "0.1"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+
+@cache
+def retryable_errors():
+    # google.api_core comes with the Gemini SDK; importing it is deferred with the SDK itself
+    from google.api_core import exceptions as api_exceptions
+
+    return (
+        TimeoutError,
+        ConnectionError,
+        api_exceptions.TooManyRequests,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.GatewayTimeout,
+        api_exceptions.DeadlineExceeded,
+        FakeBackendError,
+    )
+
+
+class StageTimeout(TimeoutError):
+    pass
+
+
+class ModelUnavailable(Exception):
+    """The model can't be reached right now; reason is "circuit_open", "timeout" or "error" """
+
+    def __init__(self, stage, reason, retry_after, cause=None):
+        super().__init__(f"{stage} model call unavailable: {reason}")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+        self.cause = cause
+
+
+def is_retryable(error):
+    return isinstance(error, retryable_errors())
+
+
+class LatencyWindow:
+    """Recent successful attempt latencies per stage, for the hedging threshold"""
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.size)).append(seconds)
+
+    def quantile(self, stage, q=0.95, min_samples=MODEL_HEDGE_MIN_SAMPLES):
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class HedgeBudget:
+    """Each call earns `ratio` of a hedge, banked up to `burst`; a hedge spends a whole one"""
+
+    def __init__(self, ratio=MODEL_HEDGE_BUDGET, burst=10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self):
+        with self._lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failed stages; lets one probe through after `cooldown`"""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def retry_after(self):
+        return max(1, int(self._opened_at + self.cooldown - time.monotonic() + 0.999))
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != "closed":
+                log.info("circuit_closed")
+            self.state = "closed"
+            self._consecutive = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.stats["opened"] += 1
+                log.warning("circuit_opened", consecutive_failures=self._consecutive, cooldown=self.cooldown)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open"] = int(self.state != "closed")
+            stats["consecutive_failures"] = self._consecutive
+        return stats
+
+
+class ResilientCaller:
+    def __init__(self, timeouts=None, retries=MODEL_RETRIES, retry_base=MODEL_RETRY_BASE, retry_max=MODEL_RETRY_MAX,
+                 hedge=MODEL_HEDGE, breaker=None):
+        self.timeouts = dict(STAGE_TIMEOUTS, **(timeouts or {}))
+        self.retries = retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.hedges = HedgeBudget()
+        # Blocking callers run hedgeable attempts here so they can return with whichever finishes first
+        self._pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="model-hedge") if hedge else None
+
+    def _retrying(self, cls, stage, deadline):
+        def out_of_time(retry_state):
+            return time.monotonic() >= deadline
+
+        def before_sleep(retry_state):
+            log.warning("model_retry", stage=stage, attempt=retry_state.attempt_number,
+                        error=repr(retry_state.outcome.exception()))
+
+        return cls(
+            stop=stop_after_attempt(self.retries + 1) | out_of_time,
+            wait=wait_random_exponential(multiplier=self.retry_base, max=self.retry_max),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+
+    def _unavailable(self, stage, error):
+        self.breaker.failure()
+        reason = "timeout" if isinstance(error, TimeoutError) else "error"
+        log.error("model_unavailable", stage=stage, reason=reason, error=repr(error))
+        return ModelUnavailable(stage, reason, self.breaker.retry_after() if self.breaker.state == "open" else 1, error)
+
+    def _check_breaker(self, stage):
+        if not self.breaker.allow():
+            MODEL_ATTEMPTS.inc(stage=stage, outcome="circuit_open")
+            raise ModelUnavailable(stage, "circuit_open", self.breaker.retry_after())
+
+    def _observe(self, stage, start, error=None):
+        if error is None:
+            self.latency.record(stage, time.monotonic() - start)
+            outcome = "ok"
+        elif isinstance(error, TimeoutError):
+            outcome = "timeout"
+        else:
+            outcome = "retryable_error" if is_retryable(error) else "error"
+        MODEL_ATTEMPTS.inc(stage=stage, outcome=outcome)
+
+    # Blocking path
+
+    def call(self, backend, step):
+        """backend.generate(step) within the stage's deadline; returns (reply, context_cached)"""
+        self._check_breaker(step.stage)
+        deadline = time.monotonic() + self.timeouts.get(step.stage, 30.0)
+        try:
+            for attempt in self._retrying(Retrying, step.stage, deadline):
+                with attempt:
+                    result = self._attempt(backend, step, deadline)
+        except Exception as e:
+            if not is_retryable(e):
+                # The API answered, it just didn't like this request
+                self.breaker.success()
+                raise
+            raise self._unavailable(step.stage, e) from e
+        self.breaker.success()
+        return result
+
+    def _timed(self, backend, step, timeout):
+        if timeout <= 0:
+            raise StageTimeout(f"{step.stage} deadline exceeded")
+        start = time.monotonic()
+        try:
+            result = backend.generate(step, timeout=timeout)
+        except Exception as e:
+            self._observe(step.stage, start, e)
+            raise
+        self._observe(step.stage, start)
+        return result
+
+    def _hedge_after(self, step, remaining):
+        """Seconds to wait before duplicating this attempt, or None for no duplicate"""
+        if not self.hedge:
+            return None
+        self.hedges.earn()
+        hedge_after = self.latency.quantile(step.stage)
+        return hedge_after if hedge_after is not None and hedge_after < remaining else None
+
+    def _attempt(self, backend, step, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise StageTimeout(f"{step.stage} deadline exceeded")
+        hedge_after = self._hedge_after(step, remaining)
+        if hedge_after is None:
+            return self._timed(backend, step, remaining)
+
+        started = []
+
+        def primary():
+            started.append(time.monotonic())
+            return self._timed(backend, step, deadline - time.monotonic())
+
+        futures = {self._pool.submit(primary)}
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done and started:
+            # Time spent queueing for a pool thread doesn't count towards hedge_after
+            done, _ = wait(futures, timeout=max(0.0, started[0] + hedge_after - time.monotonic()))
+        # An attempt still queueing isn't slow, the pool is busy; a duplicate would only add to it
+        if not done and started and self.hedges.spend():
+            MODEL_HEDGES.inc(stage=step.stage)
+            futures.add(self._pool.submit(lambda: self._timed(backend, step, deadline - time.monotonic())))
+        error = None
+        try:
+            while futures:
+                done, futures = wait(futures, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    raise StageTimeout(f"{step.stage} deadline exceeded")
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in futures:
+                future.cancel()
+
+    # Event-loop path
+
+    async def call_async(self, backend, step):
+        """Awaitable twin of call(); losing hedges and timed-out attempts are cancelled"""
+        self._check_breaker(step.stage)
+        deadline = time.monotonic() + self.timeouts.get(step.stage, 30.0)
+        try:
+            async for attempt in self._retrying(AsyncRetrying, step.stage, deadline):
+                with attempt:
+                    result = await self._attempt_async(backend, step, deadline)
+        except Exception as e:
+            if not is_retryable(e):
+                self.breaker.success()
+                raise
+            raise self._unavailable(step.stage, e) from e
+        self.breaker.success()
+        return result
+
+    async def _timed_async(self, backend, step, timeout):
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(backend.generate_async(step, timeout=timeout), timeout)
+        except asyncio.TimeoutError:
+            error = StageTimeout(f"{step.stage} deadline exceeded")
+            self._observe(step.stage, start, error)
+            raise error
+        except Exception as e:
+            self._observe(step.stage, start, e)
+            raise
+        self._observe(step.stage, start)
+        return result
+
+    async def _attempt_async(self, backend, step, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise StageTimeout(f"{step.stage} deadline exceeded")
+        hedge_after = self._hedge_after(step, remaining)
+        if hedge_after is None:
+            return await self._timed_async(backend, step, remaining)
+
+        tasks = {asyncio.ensure_future(self._timed_async(backend, step, remaining))}
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done and self.hedges.spend():
+            MODEL_HEDGES.inc(stage=step.stage)
+            tasks.add(asyncio.ensure_future(self._timed_async(backend, step, deadline - time.monotonic())))
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self):
+        stats = self.breaker.snapshot()
+        if self.hedge:
+            stats["hedge_budget"] = round(self.hedges.tokens, 2)
+        return stats
@@ -0,0 +1,55 @@
+"""Local scoring of the user's description against the image verdict.
+
+With LOCAL_SIMILARITY on, the description stage's similarity score is
+computed on the CPU instead of by the model. The blended probability, and so
+the verdict, is then known right after stage 1. The description model call is
+only made to rewrite descriptions of accepted incidents.
+
+The score is a bag-of-words cosine between the description and the image
+stage's reasoning plus its disaster type, over lower-cased, lightly stemmed
+words without stop words. It is a rough lexical stand-in for the model's
+judgement: it rewards a description that names what the image shows and
+knows nothing about paraphrase or language. Keep it off where the model's
+score matters more than the saved call.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+LOCAL_SIMILARITY = os.getenv("LOCAL_SIMILARITY", "false").lower() == "true"
+
+WORD = re.compile(r"[a-z]+")
+STOP_WORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his how
+i if in into is it its just me more most my no nor not now of off on once only or other our out over own same she
+should so some such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your image photo picture shows scene
+""".split())
+SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def _stem(word):
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def bag_of_words(text):
+    return Counter(_stem(w) for w in WORD.findall(text.lower()) if w not in STOP_WORDS)
+
+
+def cosine(a, b):
+    dot = sum(count * b[word] for word, count in a.items() if word in b)
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def description_score(description, reasoning, disaster_type):
+    """0..1, how much of the description is about what the image stage saw"""
+    reference = bag_of_words(reasoning)
+    # The type is the verdict's key fact; weight it like a repeated word
+    reference.update({word: 2 for word in bag_of_words(disaster_type)})
+    return round(min(1.0, cosine(bag_of_words(description), reference)), 3)
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and share its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.stats = {"inflight_leaders": 0, "inflight_coalesced": 0}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["inflight_leaders"] += 1
+            else:
+                self.stats["inflight_coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, fn, *args):
+        """Same as do() for coroutine functions; coalesces within one event loop"""
+        future = self._async_calls.get(key)
+        if future is not None:
+            with self._lock:
+                self.stats["inflight_coalesced"] += 1
+            # shield() so one waiter being cancelled doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn(*args))
+        self._async_calls[key] = future
+        future.add_done_callback(lambda _: self._async_calls.pop(key, None))
+        with self._lock:
+            self.stats["inflight_leaders"] += 1
+        return await asyncio.shield(future)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["inflight_keys"] = len(self._calls) + len(self._async_calls)
+        return stats
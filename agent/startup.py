@@ -0,0 +1,130 @@
+"""Fast startup: background initialisation, startup timing, liveness and readiness.
+
+Importing app.py or asgi.py only builds in-memory objects. Nothing touches the
+network, and the Gemini SDK, most of the import time, is not loaded yet.
+start() then runs the slow parts on a background thread, so a worker accepts
+connections right after import, even when the Node API is down:
+
+- model_client: import and configure the model SDK
+- types: wait for the types registry's first list (it keeps retrying)
+- warmup (STARTUP_WARMUP=true): open the model API connection and create the
+  models and context caches for the current prompts
+
+/healthz answers 200 while the process can serve HTTP at all. /readyz answers
+200 once the model client is set up and a types list is loaded, and, with
+warm-up on, once warm-up has finished or STARTUP_BUDGET seconds have passed.
+Until then it answers 503. Each phase's duration is logged in
+startup_complete and exported as agent_startup{stat=...}.
+"""
+import os
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("startup")
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() == "true"
+# Seconds from import to ready that a replica is expected to meet
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "30"))
+
+# Set when this module is imported, which the apps do first
+_import_started = time.perf_counter()
+
+
+class Startup:
+    def __init__(self, warmup=STARTUP_WARMUP, budget=STARTUP_BUDGET):
+        self.warmup = warmup
+        self.budget = budget
+        self.phases = {}
+        self.warmup_state = "pending" if warmup else "off"
+        self._ready_at = None
+        self._thread = None
+        self._backend = None
+        self._types_registry = None
+
+    def _elapsed(self):
+        return time.perf_counter() - _import_started
+
+    def imported(self):
+        """Call once the app module has finished importing"""
+        self.phases["imports"] = self._elapsed()
+        log.info("app_imported", seconds=round(self.phases["imports"], 3))
+
+    def start(self, backend, types_registry, warm_up_calls):
+        """Initialise in the background; warm_up_calls() gives the ModelCalls to warm up once types are loaded"""
+        if self._thread is not None:
+            return
+        self._backend = backend
+        self._types_registry = types_registry
+        self._thread = threading.Thread(target=self._run, args=(warm_up_calls,), name="startup", daemon=True)
+        self._thread.start()
+
+    def _timed(self, phase, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.phases[phase] = time.perf_counter() - start
+
+    def _run(self, warm_up_calls):
+        self._types_registry.start()
+        try:
+            self._timed("model_client", self._backend.init)
+        except Exception as e:
+            # Left to the first request, which will retry it and report the error
+            log.error("model_client_init_failed", error=str(e))
+        self._timed("types", self._wait_for_types)
+        if self.warmup:
+            try:
+                timeout = max(1.0, self.budget - self._elapsed())
+                self._timed("warmup", self._backend.warm_up, warm_up_calls(), timeout)
+                self.warmup_state = "done"
+            except Exception as e:
+                self.warmup_state = "failed"
+                log.warning("warmup_failed", error=str(e))
+        self.readiness()
+
+    def _wait_for_types(self):
+        while not self._types_registry.loaded:
+            time.sleep(0.05)
+
+    def _mark_ready(self):
+        if self._ready_at is not None:
+            return
+        self._ready_at = self._elapsed()
+        phases = {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+        if self._ready_at > self.budget:
+            log.warning("startup_over_budget", ready_seconds=round(self._ready_at, 3), budget=self.budget, **phases)
+        else:
+            log.info("startup_complete", ready_seconds=round(self._ready_at, 3), budget=self.budget, **phases)
+
+    def checks(self):
+        """{check: ok} behind /readyz"""
+        checks = {
+            "model_client": bool(self._backend is not None and self._backend.ready),
+            "types": bool(self._types_registry is not None and self._types_registry.loaded),
+        }
+        if self.warmup:
+            checks["warmup"] = self.warmup_state != "pending" or self._elapsed() > self.budget
+        return checks
+
+    def readiness(self):
+        """(status code, body) for /readyz"""
+        checks = self.checks()
+        ready = all(checks.values())
+        if ready:
+            self._mark_ready()
+        body = {"ready": ready, "checks": checks, "warmup": self.warmup_state,
+                "uptime_seconds": round(self._elapsed(), 3)}
+        return (200 if ready else 503), body
+
+    def snapshot(self):
+        stats = {f"{phase}_seconds": round(seconds, 4) for phase, seconds in self.phases.items()}
+        stats["ready"] = int(self._ready_at is not None)
+        if self._ready_at is not None:
+            stats["ready_seconds"] = round(self._ready_at, 4)
+        return stats
+
+
+startup = Startup()
@@ -0,0 +1,111 @@
+"""Opt-in streaming /analyze: the stage-1 verdict first, the final answer when stage 2 is done.
+
+A client asks for it with ?stream=sse or ?stream=ndjson, or with an Accept
+header of text/event-stream or application/x-ndjson. The response is 200 with
+two events:
+
+    verdict  the Verdict: is_incident, the image model's probability, the range
+             the final probability can still fall in, whether is_incident is
+             settled, type, severity and reasoning
+    result   the FinalOutput, exactly as the plain /analyze returns it
+    error    instead of result (or of both) when the analysis fails, with the
+             status plain /analyze would have answered and its error body
+
+As SSE, each is an "event: <name>" / "data: <json>" block; as NDJSON, one
+{"event": <name>, "data": {...}} line. Answers that arrive whole (cache hits,
+fused mode, a request coalesced onto an identical one) still send a settled
+verdict before the result.
+"""
+import asyncio
+import json
+import queue
+import threading
+
+from logs import get_logger
+from pipeline import AnalysisError, final_verdict
+
+log = get_logger("streaming")
+
+MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+# Keep caches and reverse proxies from holding the first event back
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_format(query_value, accept):
+    """"sse", "ndjson" or None (a plain JSON response)"""
+    if query_value in MEDIA_TYPES:
+        return query_value
+    accept = (accept or "").split(",")[0].split(";")[0].strip()
+    for fmt, media_type in MEDIA_TYPES.items():
+        if accept == media_type:
+            return fmt
+    return None
+
+
+def encode(fmt, event, data):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+    return (json.dumps({"event": event, "data": data}) + "\n").encode("utf-8")
+
+
+def _error_data(e):
+    if isinstance(e, AnalysisError):
+        return {"status": e.status, **e.payload}
+    log.error("stream_analysis_failed", error=str(e), exc_info=True)
+    return {"status": 500, "error": "Analysis failed", "details": str(e)}
+
+
+def stream_analysis(fmt, run, *args):
+    """Blocking generator of encoded events; run(*args, on_verdict=...) runs on its own thread"""
+    events = queue.Queue()
+
+    def target():
+        try:
+            events.put(("result", run(*args, on_verdict=lambda verdict: events.put(("verdict", verdict)))))
+        except Exception as e:
+            events.put(("error", e))
+
+    threading.Thread(target=target, name="analyze-stream", daemon=True).start()
+    sent_verdict = False
+    while True:
+        event, data = events.get()
+        if event == "verdict":
+            sent_verdict = True
+            yield encode(fmt, "verdict", data)
+        elif event == "result":
+            if not sent_verdict:
+                yield encode(fmt, "verdict", final_verdict(data).model_dump())
+            yield encode(fmt, "result", data)
+            return
+        else:
+            yield encode(fmt, "error", _error_data(data))
+            return
+
+
+async def stream_analysis_async(fmt, run, *args):
+    """Async generator of encoded events; run is a coroutine function taking on_verdict"""
+    verdicts = asyncio.Queue()
+    task = asyncio.ensure_future(run(*args, on_verdict=verdicts.put_nowait))
+    sent_verdict = False
+    try:
+        while not task.done():
+            getter = asyncio.ensure_future(verdicts.get())
+            await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                sent_verdict = True
+                yield encode(fmt, "verdict", getter.result())
+            else:
+                getter.cancel()
+        if not verdicts.empty():
+            sent_verdict = True
+            yield encode(fmt, "verdict", verdicts.get_nowait())
+        try:
+            result = task.result()
+        except Exception as e:
+            yield encode(fmt, "error", _error_data(e))
+            return
+        if not sent_verdict:
+            yield encode(fmt, "verdict", final_verdict(result).model_dump())
+        yield encode(fmt, "result", result)
+    finally:
+        task.cancel()
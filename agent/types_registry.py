@@ -0,0 +1,154 @@
+"""Disaster types known to the Node API, kept in memory for the analyze hot path.
+
+Readers get the last good list immediately; once it is older than the TTL a
+background refresh is kicked off (stale-while-revalidate). After an admin
+edits the types, the backend calls /refresh-types to have it re-fetched at
+once. The list always comes from the Node API, since its names are pasted
+into the model prompt. Under gunicorn that call reaches one worker; the
+others catch up within TYPES_TTL.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import normalize_field
+from logs import get_logger
+from metrics import span
+
+log = get_logger("types")
+
+
+class TypesSnapshot(NamedTuple):
+    names: tuple
+    version: str
+
+
+def types_version(names):
+    """Stable stamp for a types list; downstream caches key on this instead of the list"""
+    canonical = json.dumps(sorted(normalize_field(n) for n in names))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class TypesRegistry:
+    def __init__(self, base_url, ttl=300.0, timeout=5.0, retry_interval=10.0):
+        self.url = f"{base_url}/types" if base_url else None
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        retries = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+        self._snapshot = TypesSnapshot((), types_version(()))
+        self._loaded_at = 0.0
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+        self.stats = {"refreshes": 0, "refresh_failures": 0, "pushes": 0, "stale_reads": 0}
+
+    @property
+    def names(self):
+        return list(self._snapshot.names)
+
+    @property
+    def loaded(self):
+        """A list has been fetched or pushed at least once"""
+        return self._loaded_at > 0
+
+    def snapshot(self):
+        """Current list and version; never touches the network"""
+        snapshot = self._snapshot
+        if time.monotonic() > self._expires_at:
+            self.stats["stale_reads"] += 1
+            self.refresh_in_background()
+        return snapshot
+
+    def _set(self, names):
+        names = tuple(names)
+        with self._lock:
+            changed = names != self._snapshot.names
+            if changed:
+                self._snapshot = TypesSnapshot(names, types_version(names))
+            self._loaded_at = time.monotonic()
+            self._expires_at = self._loaded_at + self.ttl
+        if changed:
+            log.info("types_updated", types=list(names), version=self._snapshot.version)
+
+    def refresh(self):
+        """Fetch from the Node API now; on failure the previous list is kept"""
+        if not self.url:
+            log.error("types_fetch_failed", error="NODE_API is not set in environment variables.")
+            return False
+        try:
+            with span("types_fetch"):
+                response = self.session.get(self.url, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Keep serving the old list, but don't hammer a Node API that is down
+            self._expires_at = time.monotonic() + min(self.ttl, self.retry_interval)
+            self.stats["refresh_failures"] += 1
+            log.error("types_fetch_failed", error=str(e))
+            return False
+
+        # Extract only the 'name' fields
+        self._set(item["name"] for item in data if "name" in item)
+        self.stats["refreshes"] += 1
+        return True
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="types-refresh", daemon=True).start()
+
+    def push(self, names):
+        """Replace the list directly; for in-process tools and tests, not exposed over HTTP"""
+        self.stats["pushes"] += 1
+        self._set(n for n in names if isinstance(n, str) and n.strip())
+
+    def start(self, wait=False):
+        """Load on a daemon thread, then keep refreshing every TTL; wait=True blocks for the first attempt"""
+        if self._thread is None:
+            self._first_attempt = threading.Event()
+            self._thread = threading.Thread(target=self._loop, name="types-refresher", daemon=True)
+            self._thread.start()
+        if wait:
+            self._first_attempt.wait()
+
+    def _loop(self):
+        while True:
+            ok = self.refresh()
+            self._first_attempt.set()
+            # Until a first list arrives, retry sooner so the service becomes ready
+            time.sleep(self.ttl if ok or self.loaded else min(self.ttl, self.retry_interval))
+
+    def snapshot_stats(self):
+        stats = dict(self.stats)
+        stats["count"] = len(self._snapshot.names)
+        stats["age_seconds"] = round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else -1
+        return stats
+
+
+def types_registry_from_env():
+    return TypesRegistry(
+        os.getenv("NODE_API"),
+        ttl=float(os.getenv("TYPES_TTL", "300")),
+        timeout=float(os.getenv("TYPES_TIMEOUT", "5")),
+    )
@@ -0,0 +1,104 @@
+"""Uploaded images spooled to bounded temporary storage instead of held as bytes.
+
+An upload is copied from the request stream in CHUNK_BYTES pieces into a
+SpooledTemporaryFile, hashing it on the way through: up to UPLOAD_SPOOL_BYTES
+stay in memory, anything larger moves to an unlinked temp file. Werkzeug and
+Starlette already spool multipart files that way, so the apps adopt their
+file instead, and copy only when the analysis outlives the request (job mode
+and streamed responses on Flask, which closes the request's files as it ends).
+The decoder then reads the image from the file, so an in-flight request holds
+at most the spool threshold of upload bytes, plus the downscaled copy sent to
+the model.
+
+MAX_CONTENT_LENGTH caps a whole /analyze request; larger ones get a 413
+before the body is read when they declare a Content-Length, or as soon as
+the limit is passed when they don't.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(256 * 1024)))
+CHUNK_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit):
+        super().__init__(f"The upload is larger than the {limit} byte limit")
+        self.limit = limit
+
+
+class Upload:
+    """A seekable image upload with its size and SHA-256; the temp file goes away with the object"""
+
+    def __init__(self, file, size, digest=None):
+        self.file = file
+        self.size = size
+        self._digest = digest
+
+    @classmethod
+    def from_bytes(cls, data):
+        # BytesIO shares an immutable bytes object's buffer until it is written to
+        return cls(io.BytesIO(data), len(data))
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = file_sha256(self.open())
+        return self._digest
+
+    def open(self):
+        """The underlying file, rewound; one reader at a time"""
+        self.file.seek(0)
+        return self.file
+
+    def read(self):
+        return self.open().read()
+
+    def close(self):
+        self.file.close()
+
+
+def file_sha256(file):
+    """Hex SHA-256 of a binary file from its current position, read in CHUNK_BYTES pieces"""
+    # hashlib.file_digest would do this, but it is Python 3.11+ and runtime.txt pins 3.10
+    digest = hashlib.sha256()
+    while chunk := file.read(CHUNK_BYTES):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def as_upload(image):
+    """Upload or bytes -> Upload"""
+    return image if isinstance(image, Upload) else Upload.from_bytes(image)
+
+
+def _spool_file(spool_bytes):
+    return tempfile.SpooledTemporaryFile(max_size=spool_bytes, prefix="agent-upload-")
+
+
+def spool(stream, limit=MAX_CONTENT_LENGTH, spool_bytes=UPLOAD_SPOOL_BYTES):
+    """Copy a readable binary stream into an Upload; UploadTooLarge past `limit` bytes"""
+    file = _spool_file(spool_bytes)
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(CHUNK_BYTES):
+        size += len(chunk)
+        if size > limit:
+            file.close()
+            raise UploadTooLarge(limit)
+        digest.update(chunk)
+        file.write(chunk)
+    return Upload(file, size, digest.hexdigest())
+
+
+def adopt(file, limit=MAX_CONTENT_LENGTH):
+    """Wrap an already-spooled upload file (Starlette's UploadFile.file) without copying it;
+    UploadTooLarge past `limit` bytes"""
+    size = file.seek(0, os.SEEK_END)
+    if size > limit:
+        raise UploadTooLarge(limit)
+    file.seek(0)
+    return Upload(file, size, file_sha256(file))
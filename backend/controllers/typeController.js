@@ -8,6 +8,15 @@ if (!agentUrl && process.env.AGENT_API_IP && process.env.AGENT_API_PORT) {
     agentUrl = `http://${process.env.AGENT_API_IP}:${process.env.AGENT_API_PORT}`;
 }
 
+// Ask the agent to re-fetch /types now instead of waiting for its TTL; it never takes the list from the request
+const notifyAgentTypes = async () => {
+    try {
+        await axios.post(`${agentUrl}/refresh-types`);
+    } catch (error) {
+        console.error("Failed to notify agent of a types change:", error.message);
+    }
+};
+
 const getAllTypes = async (req, res) => {
     try {
         const types = await Type.find();
@@ -21,7 +30,7 @@ const addType = async (req, res) => {
     try {
         const { name, safetyTips } = req.body;
         const type = await Type.create({ name, safetyTips });
-        axios.get(`${agentUrl}/refresh-types`);
+        notifyAgentTypes();
         res.status(201).json(type);
     } catch (error) {
         res.status(500).json({ message: error.message });
@@ -39,7 +48,7 @@ const updateType = async (req, res) => {
         if (!type) {
             return res.status(404).json({ message: "Type not found." });
         }
-        axios.get(`${agentUrl}/refresh-types`);
+        notifyAgentTypes();
         res.status(200).json(type);
     } catch (error) {
         res.status(500).json({ message: error.message });
@@ -53,7 +62,7 @@ const deleteType = async (req, res) => {
         if (!type) {
             return res.status(404).json({ message: "Type not found." });
         }
-        axios.get(`${agentUrl}/refresh-types`);
+        notifyAgentTypes();
         res.status(200).json({ message: "Type deleted successfully." });
     } catch (error) {
         res.status(500).json({ message: error.message });